@@ -0,0 +1,58 @@
+/* ***************************************************
+	ExportMaxEnt
+	Write the labels, features and weights of a trained
+	Mallet MaxEnt classifier to a text file that can be
+	loaded by feat-extract/maxent.py
+	File layout:
+		labels <number of labels>
+		one label per line
+		features <number of features>
+		one feature per line
+		weights
+		one line per feature (then one for the bias), each with one weight per label
+****************************************************** */
+import java.io.*;
+
+import cc.mallet.classify.*;
+import cc.mallet.types.*;
+
+public class ExportMaxEnt {
+
+	public static void main (String[] args) throws Exception {
+		if (args.length != 2) {
+			System.err.println("Usage: java ExportMaxEnt classifier_file output_file");
+			System.exit(-1);
+		}
+		ObjectInputStream ois =
+			new ObjectInputStream (new BufferedInputStream(new FileInputStream (args[0])));
+		MaxEnt classifier = (MaxEnt) ois.readObject();
+		ois.close();
+
+		Alphabet features = classifier.getAlphabet();
+		LabelAlphabet labels = classifier.getLabelAlphabet();
+		double[] params = classifier.getParameters();
+		int numFeatures = classifier.getDefaultFeatureIndex() + 1; //parameters per label (features + bias)
+
+		PrintStream out = new PrintStream(args[1], "UTF-8");
+		out.println("labels " + labels.size());
+		for(int li=0; li < labels.size(); li++) {
+			out.println(labels.lookupObject(li).toString());
+		}
+		out.println("features " + features.size());
+		for(int fi=0; fi < features.size(); fi++) {
+			out.println(features.lookupObject(fi).toString());
+		}
+		out.println("weights");
+		for(int fi=0; fi < numFeatures; fi++) { //the last row is the bias (default feature)
+			StringBuilder row = new StringBuilder();
+			for(int li=0; li < labels.size(); li++) {
+				if(li > 0) {
+					row.append(' ');
+				}
+				row.append(params[li * numFeatures + fi]);
+			}
+			out.println(row.toString());
+		}
+		out.close();
+	}
+}
@@ -0,0 +1,306 @@
+##########################################################
+#       corenlp_client.py
+#       Annotate text with a long running CoreNLP server
+#       (instead of starting a JVM per file with annotate_text.sh)
+#       Paragraphs are sent in batches over a pool of keep alive
+#       HTTP connections, with a bounded number of requests in
+#       flight, and the xml that comes back is read straight into
+#       Sentence objects by the process_data readers
+#       StubServer answers requests with canned annotations so
+#       the client can be run without CoreNLP
+############################################################
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from urllib.parse import urlparse, urlencode, parse_qs
+import http.client
+import http.server
+import threading
+import queue
+import json
+import time
+import io
+import sys
+import pickle
+import lxml.etree as xml
+import process_data as pd
+import process_fce_data as fce
+
+#annotators used for the plain text (with dependencies) and for the delimited text (only needs tags and lemmas)
+FULL_ANNOTATORS = 'tokenize,ssplit,pos,depparse,lemma'
+DELIMITED_ANNOTATORS = 'tokenize,ssplit,pos,lemma'
+PARAGRAPH_BREAK = "\n\n" #CoreNLP's default ssplit.newlineIsSentenceBreak=two never lets a sentence cross this
+
+class AnnotationError(Exception):
+    'A batch could not be annotated by the server (after all retries)'
+    def __init__(self, message, status=None):
+        Exception.__init__(self, message)
+        self.status = status #HTTP status of the failed response (None for connection errors)
+
+class CoreNLPClient:
+    'Sends text to a CoreNLP server and returns the xml annotations'
+    def __init__(self, url='http://localhost:9000', batch_size=32, max_in_flight=4, retries=3, timeout=120.0, backoff=0.5):
+        """@params:
+                string url - address of the CoreNLP server
+                int batch_size - number of paragraphs sent per request
+                int max_in_flight - max number of requests waiting on the server at once (and pooled connections)
+                int retries - times a failed request is retried (connection errors, timeouts, 5xx responses)
+                float timeout - seconds to wait for a response
+                float backoff - seconds to wait before the first retry, doubled for each retry after that
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path or '/'
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.connections = queue.LifoQueue() #idle connections, reused for the next request
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock() #guards the counters, annotate is called from the map_batches threads
+
+    def get_connection(self):
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def post(self, text, annotators):
+        """Send one request, return the response body (bytes), raises on connection errors and non 200 responses"""
+        props = json.dumps({'annotators': annotators, 'outputFormat': 'xml'})
+        conn = self.get_connection()
+        try:
+            conn.request('POST', self.path + '?' + urlencode({'properties': props}), text.encode('utf-8'),
+                         {'Content-Type': 'text/plain; charset=utf-8'})
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        self.connections.put(conn)
+        if response.status != 200:
+            raise AnnotationError("server returned {}: {}".format(response.status, body[:200]), response.status)
+        return body
+
+    def annotate(self, text, annotators=FULL_ANNOTATORS):
+        """Return the CoreNLP xml (bytes) for text, retrying failed requests"""
+        for attempt in range(self.retries + 1):
+            with self.lock:
+                self.requests = self.requests + 1
+            try:
+                return self.post(text, annotators)
+            except (OSError, http.client.HTTPException, AnnotationError) as e:
+                with self.lock:
+                    self.failures = self.failures + 1
+                status = getattr(e, 'status', None)
+                if attempt == self.retries or (status is not None and status < 500): #bad requests are not retried
+                    raise AnnotationError("could not annotate batch after {} tries: {}".format(attempt + 1, e), status)
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def batches(self, paragraphs):
+        """Group an iterable of paragraphs (strings, or tuples of strings) into lists of batch_size"""
+        batch = []
+        for p in paragraphs:
+            batch.append(p)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def map_batches(self, func, paragraphs):
+        """Run func on each batch of paragraphs in a thread pool with at most max_in_flight batches
+            running or waiting to be read, results are yielded in order
+        """
+        pool = ThreadPoolExecutor(self.max_in_flight)
+        pending = deque()
+        try:
+            for batch in self.batches(paragraphs):
+                pending.append(pool.submit(func, batch))
+                if len(pending) >= self.max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for f in pending:
+                f.cancel()
+            pool.shutdown()
+
+    def annotate_paragraphs(self, paragraphs, annotators=FULL_ANNOTATORS):
+        """Yield the CoreNLP xml (bytes) for each batch of paragraphs"""
+        return self.map_batches(lambda batch: self.annotate(PARAGRAPH_BREAK.join(batch), annotators), paragraphs)
+
+    def annotate_delimited(self, pairs):
+        """Yield a (plain xml, delimited xml) tuple for each batch of (paragraph, delimited paragraph) pairs"""
+        def annotate_pair(batch):
+            plain = self.annotate(PARAGRAPH_BREAK.join([p[0] for p in batch]), FULL_ANNOTATORS)
+            delim = self.annotate(PARAGRAPH_BREAK.join([p[1] for p in batch]), DELIMITED_ANNOTATORS)
+            return (plain, delim)
+        return self.map_batches(annotate_pair, pairs)
+
+    def sentences(self, paragraphs, getdeps=True, check=True):
+        """Annotate paragraphs and yield a Sentence for each sentence (the same ones pd.iter_xml reads from a file)"""
+        for data in self.annotate_paragraphs(paragraphs):
+            for s in pd.iter_xml(io.BytesIO(data), getdeps, check):
+                yield s
+
+    def delimited_sentences(self, pairs, getdeps=True, check=True):
+        """Annotate (paragraph, delimited paragraph) pairs and yield Sentences with their correction pairs
+            (the same ones pd.iter_delimited_xml reads from a pair of files)
+        """
+        prev = None
+        for (plain, delim) in self.annotate_delimited(pairs):
+            for s in pd.iter_delimited_xml(io.BytesIO(plain), io.BytesIO(delim), getdeps, check):
+                if s.prev is None: #link the first sentence of a batch to the last one of the batch before
+                    s.prev = prev
+                prev = s
+                yield s
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+def fce_paragraphs(path, delimited=False):
+    """Yield the original text of each paragraph of the fce xml file(s) at path (see fce.fce_files),
+        or (original, delimited) pairs if delimited is true
+    """
+    for f in fce.fce_files(path):
+        for texts in fce.iter_fce_paragraphs(f):
+            if delimited:
+                yield ("".join(texts[fce.ORIGINAL]), "".join(texts[fce.DELIMITED]))
+            else:
+                yield "".join(texts[fce.ORIGINAL])
+
+#------------------------------------------------------------
+#       Stub server
+#-----------------------------------------------------------
+#canned (lemma, POS) for the words the stub knows, everything else is tagged as a noun with its lowercased word as lemma
+CANNED_TAGS = {'is': ('be', 'VBZ'), 'are': ('be', 'VBP'), 'was': ('be', 'VBD'), 'were': ('be', 'VBD'), 'be': ('be', 'VB'),
+               'been': ('be', 'VBN'), 'has': ('have', 'VBZ'), 'have': ('have', 'VBP'), 'had': ('have', 'VBD'),
+               'will': ('will', 'MD'), 'can': ('can', 'MD'), 'go': ('go', 'VB'), 'goes': ('go', 'VBZ'), 'went': ('go', 'VBD'),
+               'gone': ('go', 'VBN'), 'going': ('go', 'VBG'), 'i': ('I', 'PRP'), 'he': ('he', 'PRP'), 'she': ('she', 'PRP'),
+               'we': ('we', 'PRP'), 'they': ('they', 'PRP'), 'the': ('the', 'DT'), 'a': ('a', 'DT'), 'to': ('to', 'TO'),
+               'yesterday': ('yesterday', 'NN'), '.': ('.', '.'), ',': (',', ','), '@@': ('@@', 'NN'), '##': ('##', 'NN')}
+
+def stub_annotate(text, annotators):
+    """Return CoreNLP style xml (bytes) for text: tokens are split on whitespace, sentences end at '.' and
+        paragraph breaks, tags come from CANNED_TAGS, and with depparse every word depends on the first verb
+    """
+    root = xml.Element('root')
+    sentences = xml.SubElement(xml.SubElement(root, 'document'), 'sentences')
+    sents = []
+    for para in text.split(PARAGRAPH_BREAK):
+        current = []
+        for w in para.split():
+            current.append(w)
+            if w == '.':
+                sents.append(current)
+                current = []
+        if current:
+            sents.append(current)
+    for (sid, words) in enumerate(sents):
+        sen = xml.SubElement(sentences, 'sentence', id=str(sid + 1))
+        tokens = xml.SubElement(sen, 'tokens')
+        tags = [CANNED_TAGS.get(w.lower(), (w.lower(), 'NN')) for w in words]
+        for (i, (w, (lemma, pos))) in enumerate(zip(words, tags)):
+            tok = xml.SubElement(tokens, 'token', id=str(i + 1))
+            xml.SubElement(tok, 'word').text = w
+            xml.SubElement(tok, 'lemma').text = lemma
+            xml.SubElement(tok, 'POS').text = pos
+        if 'depparse' in annotators or 'parse' in annotators:
+            deps = xml.SubElement(sen, 'dependencies', type='collapsed-ccprocessed-dependencies')
+            head = ([i for (i, t) in enumerate(tags) if t[1][0] == 'V'] + [0])[0]
+            for i in range(len(words)):
+                dep = xml.SubElement(deps, 'dep', type='root' if i == head else 'dep')
+                gov = xml.SubElement(dep, 'governor', idx='0' if i == head else str(head + 1))
+                gov.text = 'ROOT' if i == head else words[head]
+                xml.SubElement(dep, 'dependent', idx=str(i + 1)).text = words[i]
+    return xml.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' #keep alive, like the real server
+
+    def do_POST(self):
+        server = self.server.stub
+        text = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        props = json.loads(parse_qs(urlparse(self.path).query).get('properties', ['{}'])[0])
+        with server.lock:
+            server.requests = server.requests + 1
+            fail = server.fail_next > 0
+            if fail:
+                server.fail_next = server.fail_next - 1
+        if fail:
+            body = b'stub failure'
+            self.send_response(server.fail_status)
+        else:
+            body = stub_annotate(text, props.get('annotators', FULL_ANNOTATORS))
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer:
+    'Local stand in for a CoreNLP server that answers with stub_annotate, run in a background thread'
+    def __init__(self, port=0, fail_next=0, fail_status=503):
+        """@params:
+                int port - port to listen on (0 picks a free one, see url)
+                int fail_next - number of requests to answer with fail_status before working normally (to test retries)
+                int fail_status - HTTP status of the failed responses
+        """
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.fail_next = fail_next
+        self.fail_status = fail_status
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+if __name__ == "__main__":
+    #ARGS prep fcepath outfile.p [--delimited] [--url=http://host:port] [--batch=N] [--in-flight=N] [--retries=N]
+    #   annotate the paragraphs of fce xml file(s) (a file, directory or glob, see process_fce_data) and save the
+    #   Sentences like process_data.py prep, without writing the text or xml files in between
+    #ARGS stub [port] (run a stub server that answers with canned annotations)
+    #--stub in prep mode annotates with a stub server started in this process instead of --url
+    opts = dict([x[2:].split('=', 1) for x in sys.argv[1:] if x.startswith('--') and '=' in x])
+    argv = [x for x in sys.argv if not x.startswith('--')]
+    if argv[1] == 'prep':
+        stub = None
+        url = opts.get('url', 'http://localhost:9000')
+        if '--stub' in sys.argv:
+            stub = StubServer().start()
+            url = stub.url
+        client = CoreNLPClient(url, int(opts.get('batch', 32)), int(opts.get('in-flight', 4)), int(opts.get('retries', 3)))
+        start = time.time()
+        if '--delimited' in sys.argv:
+            sents = list(client.delimited_sentences(fce_paragraphs(argv[2], delimited=True)))
+        else:
+            sents = list(client.sentences(fce_paragraphs(argv[2])))
+        client.close()
+        pickle.dump(sents, open(argv[3], 'wb'))
+        print("Sentences: {} Requests: {} Failed requests: {} Time: {:.2f}s".format(len(sents), client.requests,
+                                                                                    client.failures, time.time() - start))
+        if stub:
+            stub.stop()
+    elif argv[1] == 'stub':
+        port = int(argv[2]) if len(argv) > 2 else 9000
+        server = StubServer(port)
+        print("Stub CoreNLP server on {}".format(server.url))
+        server.httpd.serve_forever()
+    print("done")
@@ -0,0 +1,290 @@
+##########################################################
+#       corpus.py
+#       Columnar (array backed) storage for a collection of
+#       Sentence objects, tokens and dependencies are kept as
+#       integer ids into a shared vocabulary and Sentence objects
+#       are only built when they are asked for
+#       A ColumnarCorpus can also be written to a binary file
+#       that is read back with mmap (MappedCorpus)
+############################################################
+from lingstructs import *
+from array import array
+import sys
+import mmap
+import struct
+
+class Vocab:
+    'Maps strings to integer ids and back, id -1 is used for None'
+    def __init__(self, strings=None):
+        self.strings = []
+        self.ids = {}
+        if strings:
+            for s in strings:
+                self.add(s)
+
+    def add(self, s):
+        """Return the id of string s, adding it to the vocabulary if it is new"""
+        if s is None:
+            return -1
+        i = self.ids.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.ids[s] = i
+            self.strings.append(s)
+        return i
+
+    def get(self, i):
+        """Return the string with id i"""
+        if i < 0:
+            return None
+        return self.strings[i]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getstate__(self):
+        return self.strings
+
+    def __setstate__(self, strings):
+        self.strings = strings
+        self.ids = dict([(s, i) for (i, s) in enumerate(strings)])
+
+class SentenceView(Sentence):
+    'A Sentence built from a ColumnarCorpus, its previous sentence is only built if it is used'
+    def __init__(self, corpus, index, s, d, pairs):
+        self.corpus = corpus
+        self.index = index
+        self.prev_override = None
+        Sentence.__init__(self, s, d, pairs)
+
+    @property
+    def prev(self):
+        if self.prev_override is None and self.corpus.linked[self.index]:
+            self.prev_override = self.corpus[self.index - 1]
+        return self.prev_override
+
+    @prev.setter
+    def prev(self, value):
+        self.prev_override = value
+
+    def __reduce__(self):
+        #pickle as a plain Sentence (without the corpus)
+        return (Sentence, (self.sen, self.deps, self.corr_pairs, self.prev_override))
+
+class ColumnarCorpus:
+    'A list of Sentences stored as parallel integer arrays'
+    def __init__(self):
+        self.vocab = Vocab() #shared by words, lemmas, POS tags and dependency types
+        #token columns
+        self.words = array('i')
+        self.lemmas = array('i')
+        self.pos = array('i')
+        self.tids = array('i')
+        self.delim = array('b')
+        self.tok_offsets = array('l', [0]) #sentence i has tokens tok_offsets[i]:tok_offsets[i+1]
+        #dependency columns
+        self.dtypes = array('i')
+        self.govs = array('i')
+        self.dependents = array('i')
+        self.gov_words = array('i')
+        self.dependent_words = array('i')
+        self.dep_offsets = array('l', [0])
+        #correction pairs, the error phrase is stored as positions in the sentence's token list,
+        #the correction phrase tokens are stored in their own columns
+        self.pair_offsets = array('l', [0])
+        self.err_pos = array('i')
+        self.err_offsets = array('l', [0])
+        self.corr_words = array('i')
+        self.corr_lemmas = array('i')
+        self.corr_pos = array('i')
+        self.corr_tids = array('i')
+        self.corr_offsets = array('l', [0])
+        self.linked = array('b') #whether sentence i has sentence i-1 as its prev
+        self.last_added = None
+
+    @staticmethod
+    def from_sentences(sents):
+        """Build a ColumnarCorpus from an iterable of Sentences"""
+        corpus = ColumnarCorpus()
+        for s in sents:
+            corpus.append(s)
+        return corpus
+
+    def append(self, sentence):
+        """Add a Sentence to the end of the corpus (note: prev is only kept if it is the last sentence added)"""
+        add = self.vocab.add
+        positions = {} #id(token) -> position in sentence
+        for (i, tok) in enumerate(sentence.sen):
+            positions[id(tok)] = i
+            self.words.append(add(tok.word))
+            self.lemmas.append(add(tok.lemma))
+            self.pos.append(add(tok.pos))
+            self.tids.append(tok.tid)
+            self.delim.append(1 if tok.in_delim else 0)
+        self.tok_offsets.append(len(self.words))
+        for d in sentence.deps:
+            self.dtypes.append(add(d.dtype))
+            self.govs.append(d.gov_id())
+            self.dependents.append(d.dependent_id())
+            self.gov_words.append(add(d.gov_word()))
+            self.dependent_words.append(add(d.dependent_word()))
+        self.dep_offsets.append(len(self.dtypes))
+        for pair in sentence.corr_pairs:
+            for tok in pair.error.chain:
+                self.err_pos.append(positions[id(tok)])
+            self.err_offsets.append(len(self.err_pos))
+            for tok in pair.correction.chain:
+                self.corr_words.append(add(tok.word))
+                self.corr_lemmas.append(add(tok.lemma))
+                self.corr_pos.append(add(tok.pos))
+                self.corr_tids.append(tok.tid)
+            self.corr_offsets.append(len(self.corr_words))
+        self.pair_offsets.append(len(self.err_offsets) - 1)
+        last = getattr(self, 'last_added', None)
+        self.linked.append(1 if last is not None and sentence.prev is last else 0)
+        self.last_added = sentence
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('last_added', None)
+        return state
+
+    def __len__(self):
+        return len(self.tok_offsets) - 1
+
+    def __getitem__(self, index):
+        """Return a Sentence view of sentence index (a list of them for a slice)"""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index = index + len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("sentence index out of range")
+        get = self.vocab.get
+        toks = []
+        for i in range(self.tok_offsets[index], self.tok_offsets[index+1]):
+            toks.append(Token(get(self.words[i]), get(self.lemmas[i]), get(self.pos[i]), self.tids[i], self.delim[i] == 1))
+        deps = []
+        for i in range(self.dep_offsets[index], self.dep_offsets[index+1]):
+            gov = (get(self.gov_words[i]), self.govs[i])
+            dep = (get(self.dependent_words[i]), self.dependents[i])
+            deps.append(Dependency(get(self.dtypes[i]), gov, dep))
+        pairs = []
+        for p in range(self.pair_offsets[index], self.pair_offsets[index+1]):
+            error = [toks[self.err_pos[i]] for i in range(self.err_offsets[p], self.err_offsets[p+1])]
+            corr = []
+            for i in range(self.corr_offsets[p], self.corr_offsets[p+1]):
+                corr.append(Token(get(self.corr_words[i]), get(self.corr_lemmas[i]), get(self.corr_pos[i]), self.corr_tids[i]))
+            pairs.append(CorrectionPair(VChain(error), VChain(corr)))
+        return SentenceView(self, index, toks, deps, pairs)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+#------------------------------------------------------------
+#       Binary corpus file
+#-----------------------------------------------------------
+#Layout: header (magic, version, byte order, number of columns), a column table with
+#one (name, typecode, offset, count) entry per column, then the column data, each
+#column starting on an 8 byte boundary. The vocabulary is stored as two columns,
+#the utf-8 bytes of all strings and a table of where each string ends.
+CORPUS_MAGIC = b'VCRP'
+CORPUS_VERSION = 1
+HEADER = struct.Struct('<4sIBxxxI')
+COLUMN_ENTRY = struct.Struct('<24sc7xQQ')
+#(column name, typecode in the file), offsets are stored as 'q' so files do not depend on the size of a C long
+CORPUS_COLUMNS = [('words', 'i'), ('lemmas', 'i'), ('pos', 'i'), ('tids', 'i'), ('delim', 'b'), ('tok_offsets', 'q'),
+                  ('dtypes', 'i'), ('govs', 'i'), ('dependents', 'i'), ('gov_words', 'i'), ('dependent_words', 'i'),
+                  ('dep_offsets', 'q'), ('pair_offsets', 'q'), ('err_pos', 'i'), ('err_offsets', 'q'),
+                  ('corr_words', 'i'), ('corr_lemmas', 'i'), ('corr_pos', 'i'), ('corr_tids', 'i'),
+                  ('corr_offsets', 'q'), ('linked', 'b')]
+BYTE_ORDER = {'little': 0, 'big': 1}
+
+def is_corpus_file(filename):
+    """Return true if filename is a binary corpus file (as opposed to a pickle)"""
+    f = open(filename, 'rb')
+    magic = f.read(4)
+    f.close()
+    return magic == CORPUS_MAGIC
+
+def write_corpus(corpus, filename):
+    """Write a ColumnarCorpus to a binary corpus file that can be opened with MappedCorpus"""
+    columns = [(name, code, array(code, getattr(corpus, name))) for (name, code) in CORPUS_COLUMNS]
+    vocab_data = bytearray()
+    vocab_ends = array('q')
+    for string in corpus.vocab.strings:
+        vocab_data.extend(string.encode('utf-8'))
+        vocab_ends.append(len(vocab_data))
+    columns.append(('vocab_ends', 'q', vocab_ends))
+    columns.append(('vocab_data', 'B', array('B', vocab_data)))
+
+    offset = HEADER.size + COLUMN_ENTRY.size * len(columns)
+    table = []
+    for (name, code, data) in columns:
+        offset = (offset + 7) & ~7
+        table.append(COLUMN_ENTRY.pack(name.encode('ascii'), code.encode('ascii'), offset, len(data)))
+        offset = offset + len(data) * data.itemsize
+    outfile = open(filename, 'wb')
+    outfile.write(HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, BYTE_ORDER[sys.byteorder], len(columns)))
+    outfile.write(b"".join(table))
+    for (name, code, data) in columns:
+        outfile.write(b'\0' * (-outfile.tell() % 8))
+        data.tofile(outfile)
+    outfile.close()
+
+class MappedVocab(Vocab):
+    'Vocab read from a binary corpus file, strings are decoded the first time they are asked for'
+    def __init__(self, ends, data):
+        self.ends = ends
+        self.data = data
+        self.strings = [None] * len(ends)
+
+    def add(self, s):
+        raise TypeError("MappedVocab is read only")
+
+    def get(self, i):
+        if i < 0:
+            return None
+        s = self.strings[i]
+        if s is None:
+            start = 0 if i == 0 else self.ends[i-1]
+            s = sys.intern(bytes(self.data[start:self.ends[i]]).decode('utf-8'))
+            self.strings[i] = s
+        return s
+
+class MappedCorpus(ColumnarCorpus):
+    'A ColumnarCorpus read from a binary corpus file with mmap, only the sentences that are used are read'
+    def __init__(self, filename):
+        f = open(filename, 'rb')
+        self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        (magic, version, order, ncols) = HEADER.unpack_from(self.mapped, 0)
+        if magic != CORPUS_MAGIC:
+            raise ValueError("{} is not a corpus file".format(filename))
+        if version != CORPUS_VERSION:
+            raise ValueError("{} has corpus file version {}, expected {}".format(filename, version, CORPUS_VERSION))
+        if order != BYTE_ORDER[sys.byteorder]:
+            raise ValueError("{} was written on a machine with a different byte order".format(filename))
+        view = memoryview(self.mapped)
+        columns = {}
+        for i in range(ncols):
+            (name, code, offset, count) = COLUMN_ENTRY.unpack_from(self.mapped, HEADER.size + i * COLUMN_ENTRY.size)
+            code = code.decode('ascii')
+            size = array(code).itemsize
+            columns[name.rstrip(b'\0').decode('ascii')] = view[offset:offset + count * size].cast(code)
+        for (name, code) in CORPUS_COLUMNS:
+            setattr(self, name, columns[name])
+        self.vocab = MappedVocab(columns['vocab_ends'], columns['vocab_data'])
+        self.last_added = None
+
+    def append(self, sentence):
+        raise TypeError("MappedCorpus is read only")
+
+    def __reduce__(self):
+        #pickle by copying the columns into a regular ColumnarCorpus
+        corpus = ColumnarCorpus()
+        for (name, code) in CORPUS_COLUMNS:
+            setattr(corpus, name, array(getattr(corpus, name).typecode, getattr(self, name)))
+        corpus.vocab = Vocab([self.vocab.get(i) for i in range(len(self.vocab))])
+        return (ColumnarCorpus.__new__, (ColumnarCorpus,), corpus.__getstate__())
@@ -5,7 +5,12 @@
 #    and returns recall, precision
 ###################################################
 from lingstructs import *
+from array import array
+import numpy as np
+import multiprocessing
+import gzip
 import sys
+import os
 
 #DEPRECATED 
 def match(v1, v2):
@@ -123,13 +128,308 @@ def evaluate(method_out, gold_out, orig_out, get_fnegs=False):
 	else:
 		return (None, None)
 
+#Hit categories used by the vectorized evaluator (the same ones get_hit_stats counts), NO_HIT is for instances
+#where there is no error and the method did not change anything
+NO_HIT = 0
+TRUE_POS = 1
+FALSE_POS = 2
+INV_POS = 3
+FALSE_NEG = 4
+CATEGORY_NAMES = ['None', 'TruePos', 'FalsePos', 'InvPos', 'FalseNeg']
+
+def encode_label_files(*label_files):
+	"""Stream the label files together and encode every label as an integer code
+		(the same label gets the same code in all the files)
+		@params:
+			filenames label_files - label files, one label per line, usually method_out, gold_out, orig_out
+		@ret:
+			tuple (codes of each file..., list of labels) - the codes are numpy arrays,
+			labels[code] is the label string for a code
+	"""
+	codes = {}
+	cols = tuple([array('i') for x in label_files])
+	files = [open(x, 'r') for x in label_files]
+	try:
+		for first in files[0]: #like get_hit_stats, the first (method) file decides how many instances there are
+			lines = [first] + [f.readline() for f in files[1:]]
+			if not all(lines):
+				raise ValueError("{} has more labels than {}".format(label_files[0], " or ".join(label_files[1:])))
+			for (col, line) in zip(cols, lines):
+				label = line.strip('\n')
+				code = codes.get(label)
+				if code is None:
+					code = len(codes)
+					codes[label] = code
+				col.append(code)
+	finally:
+		for f in files:
+			f.close()
+	labels = sorted(codes, key=codes.get)
+	return tuple([np.frombuffer(c, dtype=np.int32) for c in cols]) + (labels,)
+
+def hit_categories(method, gold, orig):
+	"""Return an array with the hit category (TRUE_POS, ...) of every instance, the same decisions get_hit_stats makes
+		@params:
+			numpy arrays method, gold, orig - label codes
+	"""
+	error = gold != orig
+	category = np.full(len(method), NO_HIT, dtype=np.int8)
+	correct = method == gold
+	category[error & correct] = TRUE_POS
+	category[error & ~correct & (method == orig)] = FALSE_NEG
+	category[error & ~correct & (method != orig)] = INV_POS
+	category[~error & ~correct] = FALSE_POS
+	return category
+
+def confusion_matrices(method, gold, category, nlabels):
+	"""Per label counts and confusion matrices
+		@ret:
+			dict with:
+				'confusion' - (nlabels x nlabels) array, [gold label, method label] counts over all instances
+				'error_confusion' - the same, only for the instances with an error (gold != orig)
+				'per_label' - (nlabels x 5) array, [gold label, category] counts
+	"""
+	pairs = gold.astype(np.int64) * nlabels + method
+	error = (category == TRUE_POS) | (category == INV_POS) | (category == FALSE_NEG)
+	return {'confusion': np.bincount(pairs, minlength=nlabels * nlabels).reshape(nlabels, nlabels),
+			'error_confusion': np.bincount(pairs[error], minlength=nlabels * nlabels).reshape(nlabels, nlabels),
+			'per_label': np.bincount(gold.astype(np.int64) * len(CATEGORY_NAMES) + category,
+									 minlength=nlabels * len(CATEGORY_NAMES)).reshape(nlabels, len(CATEGORY_NAMES))}
+
+def write_trace(trace_file, method, gold, orig, category, labels):
+	"""Write one line per hit (index, category, method, gold and original label) to trace_file,
+		gzip compressed if the name ends in .gz (this replaces the lines get_hit_stats prints)
+	"""
+	if trace_file.endswith('.gz'):
+		f = gzip.open(trace_file, 'wt')
+	else:
+		f = open(trace_file, 'w')
+	for i in np.nonzero(category != NO_HIT)[0]:
+		f.write("{} {}: {} {} {}\n".format(i, CATEGORY_NAMES[category[i]], labels[method[i]], labels[gold[i]], labels[orig[i]]))
+	f.close()
+
+def evaluate_vectorized(method_out, gold_out, orig_out, trace_file=None):
+	"""Evaluate the results of the method against gold standard without printing every instance
+		@params:
+			filename method_out, gold_out, orig_out - the same as evaluate
+			filename trace_file - if given, the per instance hits are written here (see write_trace)
+		@ret:
+			a tuple (precision, recall, stats, matrices) - stats is the same (true_pos, false_pos, inv_pos, false_neg)
+			tuple get_hit_stats returns, matrices is from confusion_matrices (with the labels added under 'labels')
+	"""
+	(method, gold, orig, labels) = encode_label_files(method_out, gold_out, orig_out)
+	category = hit_categories(method, gold, orig)
+	counts = np.bincount(category, minlength=len(CATEGORY_NAMES))
+	stats = (int(counts[TRUE_POS]), int(counts[FALSE_POS]), int(counts[INV_POS]), int(counts[FALSE_NEG]))
+	if trace_file:
+		write_trace(trace_file, method, gold, orig, category, labels)
+	matrices = confusion_matrices(method, gold, category, len(labels))
+	matrices['labels'] = labels
+	print("Final Stats: {} {} {} {}".format(stats[0],stats[1],stats[2],stats[3]))
+	prec = (stats[0] + stats[2]) / (stats[0] + stats[2] + stats[1])
+	recall = stats[0] / (stats[0] + stats[2] + stats[3])
+	return (prec, recall, stats, matrices)
+
+def print_confusion(matrices):
+	"""Print the per label hit counts and the [gold, method] confusion matrix of the error instances"""
+	labels = matrices['labels']
+	width = max([len(x) for x in labels] + [8])
+	print("Per label (rows gold label):")
+	print(" " * width + " ".join([x.rjust(width) for x in CATEGORY_NAMES[1:]]))
+	for (i, l) in enumerate(labels):
+		print(l.rjust(width) + " ".join([str(x).rjust(width) for x in matrices['per_label'][i][1:]]))
+	print("Error confusion (rows gold, columns method):")
+	print(" " * width + " ".join([x.rjust(width) for x in labels]))
+	for (i, l) in enumerate(labels):
+		print(l.rjust(width) + " ".join([str(x).rjust(width) for x in matrices['error_confusion'][i]]))
+
+#####Significance testing between two systems#####
+DEFAULT_SAMPLES = 10000 #bootstrap resamples and randomization trials
+DEFAULT_BATCH = 100 #resamples drawn at once, each batch is a (batch x instances) array
+TASKS_PER_WORKER = 2 #tasks the batches are split into for each worker process
+_worker_hits = None #(hit categories of system a, of system b), set before the worker processes are forked so they share it
+
+def hit_counts(category, rows=1):
+	"""Count the hit categories of each row of category
+		@params:
+			numpy array category - (rows x instances) array of hit categories (or a single 1-d row)
+		@ret:
+			(rows x 5) array of counts indexed by category
+	"""
+	category = category.reshape(rows, -1)
+	counts = np.zeros((rows, len(CATEGORY_NAMES)), dtype=np.int64)
+	for c in range(TRUE_POS, len(CATEGORY_NAMES)): #one pass over the int8 array per category is faster than a bincount
+		counts[:, c] = np.count_nonzero(category == c, axis=1)
+	counts[:, NO_HIT] = category.shape[1] - counts.sum(axis=1)
+	return counts
+
+def hit_scores(counts):
+	"""Precision, recall and F-score (with the formulas evaluate uses) from hit counts
+		@params:
+			numpy array counts - (..., 5) counts indexed by category
+		@ret:
+			(..., 3) array of precision, recall, F-score, nan where a score is undefined
+	"""
+	counts = counts.astype(np.float64)
+	(tp, fp, inv, fn) = (counts[..., TRUE_POS], counts[..., FALSE_POS], counts[..., INV_POS], counts[..., FALSE_NEG])
+	with np.errstate(divide='ignore', invalid='ignore'):
+		prec = (tp + inv) / (tp + inv + fp)
+		recall = tp / (tp + inv + fn)
+		fscore = 2 * prec * recall / (prec + recall)
+	return np.stack([prec, recall, fscore], axis=-1)
+
+def _bootstrap_task(batches):
+	"""Worker process function, for each (seed, nsamples) in batches draw nsamples resamples (with replacement)
+		of the instances of _worker_hits
+		@ret: (total nsamples x 2 x 3) array of the scores of system a and system b on each resample
+	"""
+	(a, b) = _worker_hits
+	out = []
+	for (seed, nsamples) in batches:
+		rng = np.random.default_rng(seed)
+		idx = rng.integers(0, len(a), size=(nsamples, len(a)), dtype=np.int32) #the same resample for both systems (paired)
+		out.append(np.stack([hit_scores(hit_counts(a[idx], nsamples)), hit_scores(hit_counts(b[idx], nsamples))], axis=1))
+	return np.concatenate(out)
+
+def _randomization_task(batches):
+	"""Worker process function, for each (seed, ntrials) in batches run ntrials approximate randomization trials
+		on _worker_hits (every instance swaps the outputs of the two systems with probability 0.5)
+		@ret: (total ntrials x 3) array of the absolute score differences of the shuffled systems
+	"""
+	(a, b) = _worker_hits
+	totals = hit_counts(a) + hit_counts(b)
+	out = []
+	for (seed, ntrials) in batches:
+		rng = np.random.default_rng(seed)
+		swap = rng.integers(0, 2, size=(ntrials, len(a)), dtype=np.bool_)
+		counts_a = hit_counts(np.where(swap, b, a), ntrials)
+		counts_b = totals - counts_a #swapping only moves hits between the systems
+		out.append(np.abs(hit_scores(counts_a) - hit_scores(counts_b)))
+	return np.concatenate(out)
+
+def resample_tasks(func, total, seed, batch=DEFAULT_BATCH, pool=None, workers=1):
+	"""Run func (_bootstrap_task or _randomization_task) over total resamples of _worker_hits, batch at a time
+		Each batch gets its own seed spawned from seed, so the results only depend on seed and batch, not on workers.
+		With a pool the batches are split into a few large tasks per worker, so each task does enough work to
+		be worth sending to another process
+		@ret: the concatenated results of every batch, in order
+	"""
+	sizes = [min(batch, total - i) for i in range(0, total, batch)]
+	batches = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+	if pool is None:
+		return func(batches)
+	ntasks = min(len(batches), workers * TASKS_PER_WORKER)
+	bounds = np.linspace(0, len(batches), ntasks + 1).astype(int)
+	return np.concatenate(pool.map(func, [batches[bounds[i]:bounds[i+1]] for i in range(ntasks)]))
+
+def percentile_intervals(samples, alpha):
+	"""Return the (low, high) 1 - alpha percentile intervals of samples over its first axis, leaving out the nan
+		samples, nan where every sample is nan
+	"""
+	defined = ~np.isnan(samples).all(axis=0)
+	low = np.full(samples.shape[1:], np.nan)
+	high = np.full(samples.shape[1:], np.nan)
+	if defined.any():
+		(low[defined], high[defined]) = np.nanpercentile(samples[:, defined], [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+	return (low, high)
+
+def randomization_pvalues(diffs, observed):
+	"""p-values of the observed differences, (trials as or more different than observed + 1) / (trials + 1),
+		trials where a shuffled score is undefined are left out, and the p-value is nan if the observed difference is
+	"""
+	pvalues = np.full(len(observed), np.nan)
+	for i in range(len(observed)):
+		trials = diffs[:, i][~np.isnan(diffs[:, i])]
+		if not np.isnan(observed[i]):
+			pvalues[i] = (np.sum(trials >= abs(observed[i]) - 1e-12) + 1) / (len(trials) + 1)
+	return pvalues
+
+def compare_systems(method_a, method_b, gold_out, orig_out, samples=DEFAULT_SAMPLES, trials=DEFAULT_SAMPLES, alpha=0.05,
+					seed=0, workers=1, batch=DEFAULT_BATCH):
+	"""Bootstrap confidence intervals of the precision, recall and F-score of two systems and a paired approximate
+		randomization test of the differences between them
+		@params:
+			filename method_a, method_b - labels output by the two systems (same instances, same order)
+			filename gold_out, orig_out - gold and original labels
+			int samples - number of bootstrap resamples
+			int trials - number of randomization trials
+			float alpha - the intervals are 1 - alpha confidence intervals
+			int seed - seed of the resampling (results are the same for the same seed and batch)
+			int workers - number of processes to use
+			int batch - number of resamples drawn at once
+		@ret:
+			dict with 'scores', 'low', 'high' - (3 x 3) arrays, rows system a, system b, b - a, columns precision, recall, F-score
+			and 'pvalue' - array of the p-values of the differences in precision, recall and F-score
+			(scores that are undefined, like the precision of a system that never changes a label, are nan)
+	"""
+	global _worker_hits
+	(a, b, gold, orig, labels) = encode_label_files(method_a, method_b, gold_out, orig_out)
+	hits = (hit_categories(a, gold, orig), hit_categories(b, gold, orig))
+	observed = np.concatenate([hit_scores(hit_counts(hits[0])), hit_scores(hit_counts(hits[1]))])
+	observed = np.vstack([observed, observed[1] - observed[0]])
+	_worker_hits = hits
+	pool = None
+	try:
+		if workers > 1: #one pool for both, forked once
+			pool = multiprocessing.get_context('fork').Pool(workers)
+		boot = resample_tasks(_bootstrap_task, samples, seed, batch, pool, workers)
+		diffs = resample_tasks(_randomization_task, trials, seed + 1, batch, pool, workers)
+	finally:
+		_worker_hits = None
+		if pool is not None:
+			pool.close()
+			pool.join()
+	boot = np.concatenate([boot, (boot[:, 1] - boot[:, 0])[:, None]], axis=1)
+	(low, high) = percentile_intervals(boot, alpha)
+	return {'scores': observed, 'low': low, 'high': high, 'pvalue': randomization_pvalues(diffs, observed[2])}
+
+def print_comparison(results, alpha=0.05):
+	names = ['System A', 'System B', 'B - A']
+	print("{} confidence intervals".format(1 - alpha))
+	for (i, score) in enumerate(['Precision', 'Recall', 'F-score']):
+		print("{}:".format(score))
+		for (j, name) in enumerate(names):
+			print("    {}: {:.4f} [{:.4f}, {:.4f}]".format(name, results['scores'][j][i], results['low'][j][i], results['high'][j][i]))
+		print("    p-value: {:.4f}".format(results['pvalue'][i]))
+
 if __name__ == "__main__":
-	#ARGS: eval_results.py method-out gold-out orig-out
+	#ARGS: eval_results.py method-out gold-out orig-out [--quiet] [--trace=file.gz] [--confusion] [--check]
+	#--quiet counts the hits with numpy and does not print every instance (--trace writes them to a file instead)
+	#--confusion prints per label counts and a confusion matrix, --check also runs get_hit_stats and compares the totals
+	#ARGS: eval_results.py compare method-a-out method-b-out gold-out orig-out [--samples=10000] [--trials=10000]
+	#                      [--alpha=0.05] [--seed=0] [--workers=1] [--batch=100]
+	opts = [x for x in sys.argv[1:] if x.startswith('--')]
+	argv = [x for x in sys.argv if not x.startswith('--')]
+	trace = [x[len('--trace='):] for x in opts if x.startswith('--trace=')]
 	if sys.argv[1] == 'fneg':
 		inst = sys.argv[2]
 		fneg = 'false_negs'
 		out = sys.argv[3]
 		find_false_instances(fneg, inst, out)	
+	elif sys.argv[1] == 'compare':
+		vals = dict([x[2:].split('=', 1) for x in opts if '=' in x])
+		alpha = float(vals.get('alpha', 0.05))
+		results = compare_systems(argv[2], argv[3], argv[4], argv[5], samples=int(vals.get('samples', DEFAULT_SAMPLES)),
+								trials=int(vals.get('trials', DEFAULT_SAMPLES)), alpha=alpha, seed=int(vals.get('seed', 0)),
+								workers=int(vals.get('workers', 1)), batch=int(vals.get('batch', DEFAULT_BATCH)))
+		print_comparison(results, alpha)
+	elif opts:
+		(method, gold, orig) = argv[1:4]
+		results = evaluate_vectorized(method, gold, orig, trace[0] if trace else None)
+		print("Precision: {}".format(results[0]))
+		print("Recall: {}".format(results[1]))
+		if '--confusion' in opts:
+			print_confusion(results[3])
+		if '--check' in opts:
+			labs = [[x.strip('\n') for x in open(f, 'r').readlines()] for f in (method, gold, orig)]
+			stdout = sys.stdout
+			sys.stdout = open(os.devnull, 'w')
+			try:
+				stats = get_hit_stats(labs[0], labs[1], labs[2])
+			finally:
+				sys.stdout.close()
+				sys.stdout = stdout
+			print("get_hit_stats totals {}: {}".format(stats, 'match' if stats == results[2] else 'DIFFERENT'))
 	else:
 		method = sys.argv[1]	
 		gold = sys.argv[2]
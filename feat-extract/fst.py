@@ -72,6 +72,70 @@ class Fst:
 		else:
 			return ['ERROR']
 
+class CompiledFst:
+	'Immutable, stateless version of an Fst (same behavior as Fst.transduce on a freshly built Fst), safe to share between threads'
+	__slots__ = ('symbol_ids', 'outputs', 'table', 'width', 'empty', 'end_states')
+
+	def __init__(self, transducer):
+		"""@params:
+				Fst transducer - the transducer to compile (it is not modified)
+		"""
+		symbol_ids = {}
+		for (i, sym) in enumerate(transducer.inputs):
+			symbol_ids.setdefault(sym, i) #keep the first index, like list.index
+		width = len(transducer.inputs) + 1 #the last column is the 'empty' transition
+		table = []
+		for row in transducer.trans:
+			table.extend(row[:width])
+		set_attr = object.__setattr__
+		set_attr(self, 'symbol_ids', symbol_ids)
+		set_attr(self, 'outputs', tuple(transducer.outputs))
+		set_attr(self, 'table', tuple(table))
+		set_attr(self, 'width', width)
+		set_attr(self, 'empty', width - 1)
+		set_attr(self, 'end_states', frozenset(transducer.end_states))
+
+	def __setattr__(self, name, value):
+		raise AttributeError("CompiledFst is immutable")
+
+	def transduce(self, symbols):
+		"""Run the input symbols through fst and return outputs from states
+			@params:
+				list symbols - list of input symbols
+			@ret:
+				tuple of output symbols
+		"""
+		symbol_ids = self.symbol_ids
+		outputs = self.outputs
+		table = self.table
+		width = self.width
+		empty = self.empty
+		out = []
+		state = 1
+		for i in symbols:
+			col = symbol_ids.get(i)
+			if col is None:
+				return ('ERROR',)
+			while True: #follow the transition, then any empty transitions after it
+				new_state = table[state*width + col]
+				if new_state == -1: #a 'Do Nothing' transition
+					out.append("")
+					break
+				state = new_state
+				if not outputs[state]:
+					break
+				out.append(outputs[state])
+				if table[state*width + empty] == 0:
+					break
+				col = empty
+			if state == 0: #reached error state
+				return tuple(out)
+
+		if state in self.end_states:
+			return tuple(out)
+		else:
+			return ('ERROR',)
+
 def vchain_transducer():
 	"""Return a transducer that takes in inputs of auxiliary verbs and form of main verb and outputs tense/aspect and person/number of the verb chain"""
 	#          0     1       2       3     4     5       6     7     8        9     10    11    12     13      14      15      
@@ -281,4 +345,7 @@ def vchain_generator():
 	transducer = Fst(inputs, outputs, trans)				
 	return transducer
 
-
+#Compiled transducers, built once on import and shared by everything that needs them
+VCHAIN_FST = CompiledFst(vchain_transducer())
+FORGIVING_VCHAIN_FST = CompiledFst(forgiving_vchain_transducer())
+VCHAIN_GENERATOR = CompiledFst(vchain_generator())
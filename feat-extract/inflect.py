@@ -0,0 +1,419 @@
+##########################################################
+#       inflect.py
+#       In process verb inflection, maps a lemma and a form id
+#       (the ids from vcorrect.get_label_id) to the surface form
+#       Irregular verbs come from a built in list, everything
+#       else follows the regular spelling rules. The forms of
+#       every VerbNet lemma can be precomputed into a table
+#       file (verbforms.txt) that is loaded on startup
+############################################################
+from collections import OrderedDict
+import subprocess
+import os
+import sys
+
+#form ids, the same numbers verbTenseChanger.pl uses
+BASE = 0
+PAST = 1
+PAST_PARTICIPLE = 2
+THIRD_SINGULAR = 3
+PRESENT_PARTICIPLE = 4
+
+#default location of the table file, (next to this module)
+DEFAULT_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'verbforms.txt')
+TABLE_HEADER = '#verbforms 3' #bump when the rules change, so tables built with the old rules are not loaded
+
+#base past past_participle [third_singular present_participle]
+IRREGULAR_VERBS = """
+be was been is being
+have had had has having
+do did done does doing
+go went gone goes going
+arise arose arisen
+awake awoke awoken
+bear bore borne
+beat beat beaten
+become became become
+befall befell befallen
+begin began begun
+behold beheld beheld
+bend bent bent
+bet bet bet
+bid bid bid
+bind bound bound
+bite bit bitten
+bleed bled bled
+blow blew blown
+break broke broken
+breed bred bred
+bring brought brought
+broadcast broadcast broadcast
+build built built
+buy bought bought
+cast cast cast
+catch caught caught
+choose chose chosen
+cling clung clung
+come came come
+cost cost cost
+creep crept crept
+cut cut cut
+deal dealt dealt
+dig dug dug
+draw drew drawn
+drink drank drunk
+drive drove driven
+eat ate eaten
+fall fell fallen
+feed fed fed
+feel felt felt
+fight fought fought
+find found found
+flee fled fled
+fling flung flung
+fly flew flown
+forbid forbade forbidden
+forget forgot forgotten
+forgive forgave forgiven
+forsake forsook forsaken
+freeze froze frozen
+get got got
+give gave given
+grind ground ground
+grow grew grown
+hang hung hung
+hear heard heard
+hide hid hidden
+hit hit hit
+hold held held
+hurt hurt hurt
+keep kept kept
+kneel knelt knelt
+know knew known
+lay laid laid
+lead led led
+leave left left
+lend lent lent
+let let let
+lie lay lain
+light lit lit
+lose lost lost
+make made made
+mean meant meant
+meet met met
+pay paid paid
+put put put
+quit quit quit
+read read read
+rid rid rid
+ride rode ridden
+ring rang rung
+rise rose risen
+run ran run
+say said said
+see saw seen
+seek sought sought
+sell sold sold
+send sent sent
+set set set
+sew sewed sewn
+shake shook shaken
+shed shed shed
+shine shone shone
+shoot shot shot
+show showed shown
+shrink shrank shrunk
+shut shut shut
+sing sang sung
+sink sank sunk
+sit sat sat
+slay slew slain
+sleep slept slept
+slide slid slid
+sling slung slung
+slit slit slit
+sow sowed sown
+speak spoke spoken
+speed sped sped
+spend spent spent
+spin spun spun
+spit spat spat
+split split split
+spread spread spread
+spring sprang sprung
+stand stood stood
+steal stole stolen
+stick stuck stuck
+sting stung stung
+stink stank stunk
+stride strode stridden
+strike struck struck
+string strung strung
+strive strove striven
+swear swore sworn
+sweep swept swept
+swell swelled swollen
+swim swam swum
+swing swung swung
+take took taken
+teach taught taught
+tear tore torn
+tell told told
+think thought thought
+throw threw thrown
+thrust thrust thrust
+tread trod trodden
+understand understood understood
+wake woke woken
+wear wore worn
+weave wove woven
+weep wept wept
+win won won
+wind wound wound
+wring wrung wrung
+write wrote written
+"""
+
+#prefixes that keep the inflection of the verb they are attached to (overtake -> overtook)
+IRREGULAR_PREFIXES = ('over', 'under', 'mis', 'out', 're', 'un', 'with', 'fore', 'up')
+#verbs that look like a prefix plus an irregular verb but are regular
+REGULAR_VERBS = frozenset(['relay', 'outlay'])
+#verbs of more than one syllable that double their last consonant (stress on the last syllable, plus the
+#British kidnapped, worshipped and fuelled)
+DOUBLING_VERBS = frozenset(['abhor', 'acquit', 'admit', 'allot', 'annul', 'befit', 'begin', 'commit', 'compel',
+                            'concur', 'confer', 'control', 'defer', 'deter', 'dial', 'dispel', 'duel', 'embed', 'emit',
+                            'equip', 'excel', 'expel', 'forbid', 'forget', 'fuel', 'incur', 'infer', 'kidnap', 'occur',
+                            'omit', 'outwit', 'patrol', 'permit', 'prefer', 'propel', 'rebel', 'recur', 'refer', 'regret',
+                            'repel', 'submit', 'transfer', 'transmit', 'worship'])
+#verbs ending in a single vowel and l that do not double the l (British spelling doubles it otherwise)
+NON_DOUBLING_VERBS = frozenset(['parallel'])
+VOWELS = 'aeiou'
+
+def read_irregular(data=IRREGULAR_VERBS):
+    """Return a dict mapping the base form of each irregular verb to its 5 forms"""
+    table = {}
+    for line in data.split('\n'):
+        forms = line.split()
+        if not forms:
+            continue
+        if len(forms) == 3:
+            forms = forms + [third_singular(forms[0]), present_participle(forms[0])]
+        table[forms[0]] = tuple(forms)
+    return table
+
+def syllables(word):
+    """Rough count of the syllables in word (groups of vowels, a u after q does not count)"""
+    count = 0
+    in_vowel = False
+    for (i, c) in enumerate(word):
+        vowel = c in VOWELS or (c == 'y' and i > 0 and not in_vowel)
+        if c == 'u' and i > 0 and word[i-1] == 'q':
+            vowel = False
+        if vowel and not in_vowel:
+            count = count + 1
+        in_vowel = vowel
+    return count
+
+def doubles_consonant(word):
+    """Return true if word doubles its final consonant before -ed and -ing (stop -> stopped)"""
+    if word in DOUBLING_VERBS:
+        return True
+    if len(word) < 3 or word[-1] in VOWELS or word[-1] in 'wxy':
+        return False
+    if word[-2] not in VOWELS:
+        return False
+    if word[-3] in VOWELS and not (word[-3] == 'u' and word[-4:-3] == 'q'): #quit, qu is a consonant
+        return False
+    if word[-1] == 'l' and word not in NON_DOUBLING_VERBS: #British spelling, travel -> travelled (FCE is British)
+        return True
+    return syllables(word) == 1
+
+def third_singular(word):
+    if word.endswith(('s', 'x', 'z', 'ch', 'sh', 'o')):
+        if doubles_consonant(word): #quiz -> quizzes, the same doubling as quizzed
+            return word + word[-1] + 'es'
+        return word + 'es'
+    if len(word) > 1 and word[-1] == 'y' and word[-2] not in VOWELS:
+        return word[:-1] + 'ies'
+    return word + 's'
+
+def present_participle(word):
+    if word.endswith('ie'):
+        return word[:-2] + 'ying'
+    if word.endswith(('ee', 'ye', 'oe')):
+        return word + 'ing'
+    if len(word) > 2 and word[-1] == 'e':
+        return word[:-1] + 'ing'
+    if word.endswith('c'):
+        return word + 'king'
+    if doubles_consonant(word):
+        return word + word[-1] + 'ing'
+    return word + 'ing'
+
+def past(word):
+    if word[-1] == 'e':
+        return word + 'd'
+    if len(word) > 1 and word[-1] == 'y' and word[-2] not in VOWELS:
+        return word[:-1] + 'ied'
+    if word.endswith('c'):
+        return word + 'ked'
+    if doubles_consonant(word):
+        return word + word[-1] + 'ed'
+    return word + 'ed'
+
+def regular_forms(word):
+    """Return the 5 forms of a regular verb (base, past, past participle, third singular, present participle)"""
+    p = past(word)
+    return (word, p, p, third_singular(word), present_participle(word))
+
+IRREGULAR = read_irregular()
+
+def irregular_forms(word):
+    """Return the 5 forms of word if it is irregular (or an irregular verb with a prefix), else None"""
+    forms = IRREGULAR.get(word)
+    if forms or word in REGULAR_VERBS:
+        return forms
+    for prefix in IRREGULAR_PREFIXES:
+        if word.startswith(prefix) and word[len(prefix):] in IRREGULAR:
+            return tuple([prefix + f for f in IRREGULAR[word[len(prefix):]]])
+    return None
+
+def verb_forms(lemma):
+    """Return the 5 forms of lemma, for multiword lemmas (take_off) only the first word is inflected"""
+    lemma = lemma.lower()
+    if '_' in lemma:
+        (first, rest) = lemma.split('_', 1)
+        return tuple([f + '_' + rest for f in verb_forms(first)])
+    if not lemma:
+        return ('', '', '', '', '')
+    forms = irregular_forms(lemma)
+    if forms is None:
+        forms = regular_forms(lemma)
+    return forms
+
+class Inflector:
+    'Bounded LRU cache of (lemma, form id) -> surface form in front of the precomputed table and the spelling rules'
+    def __init__(self, table=None, maxsize=4096):
+        """@params:
+                dict table - maps a lemma to its 5 forms (see build_table), lemmas not in it are inflected with the rules
+                int maxsize - max number of entries in the cache
+        """
+        if table is None:
+            table = {}
+        self.table = table
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def inflect(self, lemma, form):
+        """Return the form (one of the form ids above) of the verb lemma"""
+        key = (lemma, form)
+        word = self.entries.get(key)
+        if word is not None:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+            return word
+        self.misses = self.misses + 1
+        forms = self.table.get(lemma)
+        if forms is None:
+            forms = verb_forms(lemma)
+        if form < BASE or form > PRESENT_PARTICIPLE:
+            form = BASE
+        word = forms[form]
+        self.entries[key] = word
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+        return word
+
+    def stats(self):
+        """Return a (hits, misses, evictions) tuple"""
+        return (self.hits, self.misses, self.evictions)
+
+def build_table(lemmas):
+    """Return a dict mapping each lemma to its 5 forms"""
+    return dict([(lem, verb_forms(lem)) for lem in lemmas])
+
+def save_table(table, filename=DEFAULT_TABLE_FILE):
+    """Write a table to a text file, one lemma per line followed by its 5 forms (tab seperated)"""
+    outfile = open(filename, 'w')
+    outfile.write(TABLE_HEADER + "\n")
+    for lem in sorted(table):
+        outfile.write("\t".join((lem,) + tuple(table[lem])) + "\n")
+    outfile.close()
+
+def load_table(filename=DEFAULT_TABLE_FILE):
+    """Load a table written by save_table
+        @ret:
+            the table, or None if the file is missing or was written with a different version
+    """
+    if not os.path.exists(filename):
+        return None
+    infile = open(filename, 'r')
+    if infile.readline().rstrip('\n') != TABLE_HEADER:
+        infile.close()
+        return None
+    table = {}
+    for line in infile:
+        fields = line.rstrip('\n').split('\t')
+        table[fields[0]] = tuple(fields[1:])
+    infile.close()
+    return table
+
+_inflector = None #shared inflector, created on first use
+
+def get_inflector(filename=DEFAULT_TABLE_FILE):
+    """Return the shared Inflector, loading the table file the first time this is called
+        (without the table file every lemma goes through the rules, which gives the same forms, just slower)
+    """
+    global _inflector
+    if _inflector is None:
+        _inflector = Inflector(load_table(filename))
+    return _inflector
+
+def inflect(lemma, form):
+    """Return the form (one of the form ids above) of the verb lemma"""
+    return get_inflector().inflect(lemma, form)
+
+def perl_mismatches(lemmas, script='./verbTenseChanger.pl'):
+    """Run the Perl script on every form of every lemma and yield where it disagrees with verb_forms
+        (starts a process per form, so this is only for checking the rules)
+        @ret:
+            (lemma, form id, our form, perl form) tuples
+    """
+    for lem in lemmas:
+        forms = verb_forms(lem)
+        for form in range(len(forms)):
+            perl = subprocess.check_output([script, lem, '0', str(form)]).decode('utf-8').strip()
+            if perl != forms[form]:
+                yield (lem, form, forms[form], perl)
+
+if __name__ == "__main__":
+    #ARGS build [outfile] (table of the forms of every VerbNet lemma, run python vnlexicon.py build first)
+    #ARGS forms lemma [lemma ...]
+    #ARGS perl-check [script] (every form of the table lemmas against verbTenseChanger.pl, prints the mismatches)
+    if sys.argv[1] == 'build':
+        import vnlexicon
+        if len(sys.argv) > 2:
+            outfile = sys.argv[2]
+        else:
+            outfile = DEFAULT_TABLE_FILE
+        lemmas = set(vnlexicon.get_lexicon().lemmas) | set(IRREGULAR)
+        table = build_table(lemmas)
+        save_table(table, outfile)
+        print("Wrote the forms of {} lemmas".format(len(table)))
+    elif sys.argv[1] == 'forms':
+        for lem in sys.argv[2:]:
+            print(" ".join(verb_forms(lem)))
+    elif sys.argv[1] == 'perl-check':
+        import vnlexicon
+        script = sys.argv[2] if len(sys.argv) > 2 else './verbTenseChanger.pl'
+        lemmas = sorted(set(vnlexicon.get_lexicon().lemmas) | set(IRREGULAR))
+        mismatches = 0
+        for (lem, form, ours, perl) in perl_mismatches(lemmas, script):
+            print("{} {}: {} (perl {})".format(lem, form, ours, perl))
+            mismatches = mismatches + 1
+        print("{} mismatches in {} lemmas".format(mismatches, len(lemmas)))
+    print("done")
@@ -5,15 +5,41 @@
 #       pipeline
 ############################################################
 import fst
+import sys
 import string
-from nltk.corpus import verbnet
+from collections import OrderedDict
+import vnlexicon
 
-class Token:
+def intern_str(s):
+    """Intern s if it is a string (POS tags, lemmas and dependency types repeat a lot, so share one copy of each)"""
+    if isinstance(s, str):
+        return sys.intern(s)
+    else:
+        return s
+
+class SlotState:
+    'Base of the __slots__ classes below, lets them load pickles made before they used __slots__'
+    __slots__ = ()
+    SLOT_DEFAULTS = {} #values of slots that objects pickled by older versions do not have
+
+    def __setstate__(self, state):
+        #objects pickled with __slots__ have a (None, slots dict) state, older ones pickled their __dict__
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **state[1])
+        for (name, value) in self.SLOT_DEFAULTS.items():
+            if name not in state:
+                object.__setattr__(self, name, value)
+        for (name, value) in state.items():
+            object.__setattr__(self, name, value)
+
+class Token(SlotState):
     'Holds the data for a single token'
+    __slots__ = ('word', 'lemma', 'pos', 'tid', 'in_delim')
+    SLOT_DEFAULTS = {'in_delim': False} #the old NullToken did not set in_delim
     def __init__(self, word, lemma, pos, tid, delim=False):
         self.word = word.lower()  #lower() added 
-        self.lemma = lemma
-        self.pos = pos
+        self.lemma = intern_str(lemma)
+        self.pos = intern_str(pos)
         self.tid = tid #token id (ie position in sentence)
         self.in_delim = delim #whether or not this token is in a delimited (error) phrase 
 
@@ -94,24 +120,55 @@ class Token:
         else:
             return False
 
+class FrozenToken(Token):
+    'A Token that can not be changed after it is made, used for the tokens shared by every sentence'
+    __slots__ = ()
+    def __init__(self, word, lemma, pos, tid):
+        object.__setattr__(self, 'word', word)
+        object.__setattr__(self, 'lemma', lemma)
+        object.__setattr__(self, 'pos', pos)
+        object.__setattr__(self, 'tid', tid)
+        object.__setattr__(self, 'in_delim', False)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is a shared token and can not be changed".format(self.word))
+
 #note that most token/token property searching methods just return a NullToken object if 
 #no sutiable token/token property could be found
-class NullToken(Token):
-    'NullToken class represents non exsistent Tokens, use for error handeling'
+class NullToken(FrozenToken):
+    'NullToken class represents non exsistent Tokens, use for error handeling (use the shared NULL_TOKEN)'
+    __slots__ = ()
     def __init__(self):
-        self.word = '__NULL__TOKEN'
-        self.lemma = '__NULL__TOKEN'
-        self.pos = '__NULL__TOKEN'
-        self.tid = -1
+        FrozenToken.__init__(self, '__NULL__TOKEN', '__NULL__TOKEN', '__NULL__TOKEN', -1)
+
+    def __reduce__(self):
+        return 'NULL_TOKEN'
+
+class RootToken(FrozenToken):
+    'The ROOT token (tid 0) of a sentence (use the shared ROOT_TOKEN)'
+    __slots__ = ()
+    def __init__(self):
+        FrozenToken.__init__(self, 'root', 'ROOT', 'ROOT', 0)
+
+    def __reduce__(self):
+        return 'ROOT_TOKEN'
 
-class VChain:
+NULL_TOKEN = NullToken()
+ROOT_TOKEN = RootToken()
+
+class VChain(SlotState):
     'Represents a chain of verb Token objects'
+    __slots__ = ('chain', 'start', 'end', 'position', 'length', 'prev')
+    SLOT_DEFAULTS = {'prev': None}
     def __init__(self, chain, start=None, end=None, position=-1,):
         """@params:
                 List of Tokens chain
                 int start, end - tid of where the verb chain starts (inclusive),
                                  and where it ends (exclusive)
         """
+        #prev is the verb chain before this one (possibly in the previous sentence), or None,
+        #Sentence.get_vchains() sets it, False means it has not been looked up yet
+        self.prev = None
         if start == None:
             start = chain[0].tid
         if end == None:
@@ -122,9 +179,6 @@ class VChain:
         self.position = position #what number verb chain it is in the sentence
         self.length = len(self.chain)
     
-    def length(self):
-        return self.length
-    
     def range(self):
         """Return (start tid, end tid) tuple"""
         return (self.start, self.end)
@@ -138,30 +192,40 @@ class VChain:
     def last(self):
         return self.chain[self.length - 1]
 
+    def signature(self):
+        """Return a hashable (word, lemma, pos) signature of the chain, chains with the same signature get the same labels"""
+        return tuple([(x.word, x.lemma, x.pos) for x in self.chain])
+
     def head(self):
         """Return head of verb chain (return the last verb pretty much)"""
-        found = False
-        for i in self.chain:
-            if i.isverb():
-                found = True
-                head = i
-        if not found:
-            head = self.last()
-        return head
+        return self.chain[CHAIN_CACHE.lookup(self).head_index]
+
+    def head_index(self):
+        """Return the index in chain of the head of the verb chain (uncached, use head())"""
+        index = self.length - 1
+        for (i, tok) in enumerate(self.chain):
+            if tok.isverb():
+                index = i
+        return index
 
     def fst_sequence(self):
         """Return a representation of the verb chain that can be used in the fst"""
+        return list(CHAIN_CACHE.lookup(self).fst_seq)
+
+    def compute_fst_sequence(self, head_index):
+        """Build the fst sequence of the chain (uncached, use fst_sequence())"""
         seq = []
         other_aux = ['be', 'being', 'having', 'doing']  
-        for i in self.chain:
+        for (index, i) in enumerate(self.chain):
             if i.isaux() and i.pos != 'MD' and (i not in other_aux):
                 seq.append(i.abbv_to_word())
-            elif (not i.isadverb() or (i in other_aux) or i.tid == self.head().tid) and i.pos != 'MD':
+            elif (not i.isadverb() or (i in other_aux) or index == head_index) and i.pos != 'MD':
                 seq.append(i.pos)
         return seq
 
-class CorrectionPair:
+class CorrectionPair(SlotState):
     'Represents a error annotated verb phrase and its corresponding correction'
+    __slots__ = ('error', 'correction')
     def __init__(self, error, corr):
         """@params: (VChain) error, corr"""
         self.error = error
@@ -170,8 +234,9 @@ class CorrectionPair:
     def tostring(self):
         return "{} -> {}".format(self.error.tostring(), self.correction.tostring()) 
                 
-class Dependency:
+class Dependency(SlotState):
     'Holds a dependency relation for tokens in a sentence'
+    __slots__ = ('dtype', 'gov', 'dependent')
     def __init__(self, dtype, gov, dependent):
         """@params: 
                 string dtype - type of relation
@@ -179,7 +244,7 @@ class Dependency:
                 2-Tuple dependent - tuple (dependent string, idx) for dependent
         """
         #For a list of dependency types used see http://universaldependencies.github.io/docs/en/dep/all.html
-        self.dtype = dtype
+        self.dtype = intern_str(dtype)
         self.gov = gov 
         self.dependent = dependent
 
@@ -197,6 +262,7 @@ class Dependency:
 
 class CorrectionFeatures:   
     'Creates and stores features for a verb phrase error and correction, can be used as a baseclass for other feature vectors'
+    context_width = 1 #number of non punctuation tokens on each side of the verb chain to use as features
     def __init__(self, createfrom, s):
         """
         CorrectionFeatures can be created from scratch (when createfrom is a CorrectionPair)
@@ -215,7 +281,7 @@ class CorrectionFeatures:
         elif isinstance(createfrom, CorrectionFeatures):
             self.sentence = createfrom.sentence
             self.instance = createfrom.instance 
-            self.fvect = self.create_fvect(createfrom.fvect)
+            self.fvect = self.create_fvect(list(createfrom.fvect)) #copy, so one base can be used for several feature types
             self.label = self.get_target()
 
     def create_fvect(self, createfrom=None): 
@@ -234,15 +300,11 @@ class CorrectionFeatures:
         error = self.instance.error
         #extract data needed for features
         subj = self.sentence.get_subject_token()[0]
-        left = self.sentence.get_token_left(error.first().tid)
-        right = self.sentence.get_token_right(error.last().tid)
-
-        left2 = self.sentence.get_token_left(left.tid)
-        left3 = self.sentence.get_token_left(left2.tid)
-        left4 = self.sentence.get_token_left(left3.tid)
-        right2 = self.sentence.get_token_right(right.tid)
-        right3 = self.sentence.get_token_right(right2.tid)
-        right4 = self.sentence.get_token_right(right3.tid)
+        width = max(self.context_width, 1)
+        lefts = self.sentence.window_left(error.first().tid, width)
+        rights = self.sentence.window_right(error.last().tid, width)
+        left = lefts[0]
+        right = rights[0]
 
         leftnoun = closest_noun(error.first(), self.sentence, True)
         rightnoun = closest_noun(error.last(), self.sentence, False)
@@ -262,21 +324,12 @@ class CorrectionFeatures:
 
         det = self.sentence.get_det(subj.tid) 
 
-        vnet_classes = verbnet.classids(error.head().lemma)
-        if not vnet_classes:
-            vnet_class = []
-        else:
-            vnet_class = ["".join([x for x in classes if str.isalpha(x)]) for classes in vnet_classes]
-            vnet_class = [x + "class" for x in vnet_class]
+        lexicon = vnlexicon.get_lexicon()
+        vnet_class = [x + "class" for x in lexicon.class_feats(error.head().lemma)]
 
         if prevphrase:
             prevhead = prevphrase.head()
-            c = verbnet.classids(prevhead.lemma)
-            if not c:   
-                prevclass = None 
-            else:
-                prevclass = c[0] 
-                prevclass = "".join([x for x in prevclass if str.isalpha(x)])
+            prevclass = lexicon.first_class(prevhead.lemma)
             prevaspect = get_aspect(prevphrase)
         else:
             prevhead = None
@@ -294,20 +347,11 @@ class CorrectionFeatures:
         if prevaspect:
             fvect.append(prevaspect + "prevaspect")
 
-#       fvect.append(right2.abbv_to_word())
-#       fvect.append(left2.abbv_to_word())
-#       fvect.append(right2.pos)
-#       fvect.append(left2.pos)
-
-#       fvect.append(right3.word + "right")
-#       fvect.append(left3.word + "left")
-#       fvect.append(right3.pos + "right")
-#       fvect.append(left3.pos + "left")
-#
-#       fvect.append(right4.word + "right")
-#       fvect.append(left4.word + "left")
-#       fvect.append(right4.pos + "right")
-#       fvect.append(left4.pos + "left")
+        for i in range(1, width): #wider context (left2, right2, ...), only if context_width > 1
+            fvect.append(rights[i].abbv_to_word() + "right" + str(i+1))
+            fvect.append(lefts[i].abbv_to_word() + "left" + str(i+1))
+            fvect.append(rights[i].pos + "right" + str(i+1))
+            fvect.append(lefts[i].pos + "left" + str(i+1))
 
         fvect.append(right.abbv_to_word() + "right")
         fvect.append(right.pos + "right")
@@ -416,8 +460,68 @@ class PersonNumFeatures(CorrectionFeatures):
 #------------------------------------------------------------
 #       Various general helping functions
 #-----------------------------------------------------------
+class ChainInfo:
+    'Everything computed from a verb chain signature: its labels, fst sequence and head'
+    def __init__(self, aspect, person_number, forgiving_aspect, fst_seq, head_index):
+        self.aspect = aspect #tense/aspect label (get_vchain_labels()[0])
+        self.person_number = person_number #person/number label (get_vchain_labels()[1])
+        self.forgiving_aspect = forgiving_aspect #aspect from the forgiving transducer (get_aspect())
+        self.fst_seq = fst_seq #tuple, the fst sequence of the chain
+        self.head_index = head_index #index of the head token in the chain
+
+class ChainCache:
+    'Bounded LRU cache mapping a verb chain signature to its ChainInfo'
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, vseq):
+        """Return the ChainInfo for VChain vseq, computing it if its signature has not been seen"""
+        key = vseq.signature()
+        info = self.entries.get(key)
+        if info is not None:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+            return info
+        self.misses = self.misses + 1
+        head_index = vseq.head_index()
+        seq = vseq.compute_fst_sequence(head_index)
+        labels = compute_vchain_labels(vseq, seq)
+        info = ChainInfo(labels[0], labels[1], compute_aspect(vseq, seq), tuple(seq), head_index)
+        self.entries[key] = info
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+        return info
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a (hits, misses, evictions) tuple"""
+        return (self.hits, self.misses, self.evictions)
+
+    def add_stats(self, stats):
+        """Add a (hits, misses, evictions) tuple to the counters (the lookups done by a worker process)"""
+        self.hits = self.hits + stats[0]
+        self.misses = self.misses + stats[1]
+        self.evictions = self.evictions + stats[2]
+
+#cache shared by all feature extraction (training and testing)
+CHAIN_CACHE = ChainCache()
+
 def get_aspect(vseq):
     """Find the aspect of a verb chain vseq (represented as VChain object)"""
+    return CHAIN_CACHE.lookup(vseq).forgiving_aspect
+
+def compute_aspect(vseq, seq):
+    """Uncached get_aspect, seq is the fst sequence of vseq"""
     filtered = [x for x in vseq.chain if (x.isverb() and x.pos != 'MD')]
     if vseq.first().pos == 'TO' and vseq.length > 1:
         aspect = 'INF'
@@ -427,9 +531,7 @@ def get_aspect(vseq):
         else:
             aspect = 'PR_SIMPLE'
     else:
-        seq = vseq.fst_sequence()
-        transducer = fst.forgiving_vchain_transducer()
-        aspect_list = transducer.transduce(seq)
+        aspect_list = fst.FORGIVING_VCHAIN_FST.transduce(seq)
         if 'ERROR' in aspect_list:
             aspect = 'ERROR'
         else:
@@ -453,6 +555,11 @@ def get_vchain_labels(vseq):
         @ret:
             tuple labels - tuple of labels, (tense/aspect, person/number)
     """
+    info = CHAIN_CACHE.lookup(vseq)
+    return (info.aspect, info.person_number)
+
+def compute_vchain_labels(vseq, seq):
+    """Uncached get_vchain_labels, seq is the fst sequence of vseq"""
     #a value of ERROR indicates no value for the property, the reason for this may or may not be due to an error
     filtered = [x for x in vseq.chain if (x.isverb() and x.pos != 'MD')]
     aspect=''
@@ -473,10 +580,8 @@ def get_vchain_labels(vseq):
                 person_number = '1ST'
 
     else:
-        seq = vseq.fst_sequence()
-    #    transducer = fst.forgiving_vchain_transducer()
-        transducer = fst.vchain_transducer()
-        labels_list = transducer.transduce(seq)
+    #    labels_list = fst.FORGIVING_VCHAIN_FST.transduce(seq)
+        labels_list = fst.VCHAIN_FST.transduce(seq)
         if 'ERROR' in labels_list:
             labels = ('ERROR', 'ERROR')
         else:
@@ -499,110 +604,55 @@ def get_vchain_labels(vseq):
     return (aspect, person_number)
 
 def generate_aspect(seq):
-    transducer = fst.vchain_generator()
-    aspect = " ".join(transducer.transduce(seq))
+    aspect = " ".join(fst.VCHAIN_GENERATOR.transduce(seq))
     return aspect
 
 def last_in_sentence(tok, sentence):
-    index = tok.tid
-    index = index + 1   
-    last = True
-    while not (index >= len(sentence.sen)):
-        temptok = sentence.get_token(index)
-        if temptok.isverb():
-            last = False
-        index = index + 1
-    return last
+    """Return true if there is no verb after tok in sentence (the last token of the sentence is not checked)"""
+    index = sentence.category_index()
+    return index.find(index.verb_right, tok.tid) == -1
+
+#note: 'already' 'recently' is missing a comma so it is one word, kept as is so the features do not change
+TIME_ADVERBS = frozenset(['now', 'then', 'today', 'tomorrow', 'tonight', 'yesterday', 'usually', 
+                          'later', 'yet', 'still', 'already' 'recently', 'sometimes', 'always', 'ago'])
 
 def time_adverb(tok, sentence, left=False):
         """look for time adverb to the left/right of tok in sentence"""
-        adverb_list = ['now', 'then', 'today', 'tomorrow', 'tonight', 'yesterday', 'usually', 
-                        'later', 'yet', 'still', 'already' 'recently', 'sometimes', 'always', 'ago']
-        index = tok.tid 
+        index = sentence.category_index()
         if left:
-            index = index - 1
-            while not (index <= 0):
-                temptok = sentence.get_token(index)
-                if temptok.word.lower() in adverb_list:
-                    return temptok
-                else:
-                    index = index - 1
-        else: #search right
-            index = index + 1
-            while not (index >= len(sentence.sen)):
-                temptok = sentence.get_token(index)
-                if temptok.word.lower() in adverb_list:
-                    return temptok
-                else:
-                    index = index + 1
-
-        return NullToken() #return null if no time adverb in sentence
+            return sentence.get_token(index.find(index.adverb_left, tok.tid))
+        else: #search right (the last token of the sentence is not checked)
+            return sentence.get_token(index.find(index.adverb_right, tok.tid))
     
 def prev_vphrase(vphrase, sentence):
     """return the previous verb phrase"""
-    chains = sentence.get_vchains()
-    if vphrase.position == 0:
-        if sentence.prev and sentence.prev.get_vchains():
-            prevchains = sentence.prev.get_vchains()
-            return prevchains[len(prevchains) - 1] 
-        else:
-            return None
-    elif vphrase.position > 0:
-        return chains[vphrase.position - 1]
-    else:
+    if vphrase.position < 0: #not one of the sentence's verb chains
         return None
+    if vphrase.prev is False:
+        sentence.get_vchains() #links the first chain to the previous sentence
+    return vphrase.prev
         
 def closest_nonverb(tok, sentence, left=False):
     """Helping function to return the nonverb/nonadverb token that is closest to 
         tok in the Sentence object sentence.
         If left = True, then look left, else look right
     """
-    index = tok.tid
-    closest_tok = NullToken() 
+    index = sentence.category_index()
     if left:
-        index = index - 1
-        while not (index < 0):
-            temptok = sentence.get_token(index)
-            if temptok.pos[0] != 'V' and temptok.pos[0] != 'R' and (str.isalpha(temptok.word) or temptok.word == '.') and temptok.pos != 'MD':
-                closest_tok = temptok
-                break
-            index = index - 1
+        return sentence.get_token(index.find(index.nonverb_left, tok.tid))
     else:
-        index = index + 1
-        while not (index > len(sentence.sen)):
-            temptok = sentence.get_token(index)
-            if temptok.pos[0] != 'V' and temptok.pos[0] != 'R' and (str.isalpha(temptok.word) or temptok.word == '.') and temptok.pos != 'MD':
-                closest_tok = temptok
-                break
-            index = index + 1
-    return closest_tok
+        return sentence.get_token(index.find(index.nonverb_right, tok.tid))
 
 def closest_noun(tok, sentence, left=False):
     """Helping function to return the noun token that is closest to 
         tok in the Sentence object sentence.
         If left = True, then look left, else look right
     """
-    index = tok.tid
-    closest_tok = NullToken() 
+    index = sentence.category_index()
     if left:
-        index = index - 1
-        while not (index < 0):
-            temptok = sentence.get_token(index)
-            #if temptok.pos[0] == 'N':
-            if temptok.pos[0] == 'N' or temptok.pos == 'PRP' or temptok.pos == 'PRP$':
-                closest_tok = temptok
-                break
-            index = index - 1
+        return sentence.get_token(index.find(index.noun_left, tok.tid))
     else:
-        index = index + 1
-        while not (index > len(sentence.sen)):
-            temptok = sentence.get_token(index)
-            #if temptok.pos[0] == 'N':
-            if temptok.pos[0] == 'N' or temptok.pos == 'PRP' or temptok.pos == 'PRP$':
-                closest_tok = temptok
-                break
-            index = index + 1
-    return closest_tok
+        return sentence.get_token(index.find(index.noun_right, tok.tid))
 
 def last_in_chain(tok, sentence):
     """test whether the Token object tok, in the Sentence object sentence
@@ -610,16 +660,8 @@ def last_in_chain(tok, sentence):
     """
     if not tok.isverb():
         return False
-    last = False
-    right = sentence.get_token(tok.tid + 1)
-    if not right.isverb():
-        #if its an adverb, we need to see if there is a verb after it
-        if right.pos[0] == 'R':
-            if not sentence.get_token(right.tid + 1).isverb(): 
-                last = True
-        else:
-            last = True
-    return last
+    index = sentence.category_index()
+    return index.lookup(index.last_bits, tok.tid, True)
     
 def first_in_chain(tok, sentence):
     """test whether the Token object tok, in the Sentence object sentence
@@ -627,17 +669,107 @@ def first_in_chain(tok, sentence):
     """
     if not tok.isverb():
         return False
-    first = False
-    left = sentence.get_token(tok.tid - 1)
-    if not left.isverb():
-        #if its an adverb, we need to see if there is a verb before it
-        if left.pos[0] == 'R':
-            if not sentence.get_token(left.tid - 1).isverb(): 
-                first = True
-        else:
-            first = True
-    return first
+    index = sentence.category_index()
+    return index.lookup(index.first_bits, tok.tid, True)
          
+def is_time_adverb(tok):
+    """Return true if tok is one of the TIME_ADVERBS"""
+    return tok.word.lower() in TIME_ADVERBS
+
+def is_noun(tok):
+    """Return true if tok is a noun or pronoun"""
+    return tok.pos[0] == 'N' or tok.pos == 'PRP' or tok.pos == 'PRP$'
+
+def is_nonverb(tok):
+    """Return true if tok is a word (or '.') that is not a verb, adverb or modal"""
+    return tok.pos[0] != 'V' and tok.pos[0] != 'R' and (str.isalpha(tok.word) or tok.word == '.') and tok.pos != 'MD'
+
+class CategoryIndex:
+    """Nearest time adverb, noun/pronoun, non verb (and verb) to the left and right of every position
+        in a sentence, plus whether each position starts/ends a verb chain. Built with one left to right
+        and one right to left sweep. Tables are indexed by tid + 1 for tids -1 to n+1, use find/lookup.
+    """
+    def __init__(self, sentence):
+        n = len(sentence.sen)
+        self.n = n
+        toks = [sentence.get_token(t) for t in range(n + 1)] #index 0 is ROOT
+        adverb = [t > 0 and is_time_adverb(toks[t]) for t in range(n + 1)]
+        noun = [is_noun(x) for x in toks]
+        nonverb = [is_nonverb(x) for x in toks]
+        verb = [x.isverb() for x in toks]
+        #the old right hand searches for time adverbs and verbs stopped before the last token
+        adverb_r = [adverb[t] and t < n for t in range(n + 1)]
+        verb_r = [verb[t] and t < n for t in range(n + 1)]
+
+        size = n + 3
+        self.adverb_left = [-1] * size
+        self.noun_left = [-1] * size
+        self.nonverb_left = [-1] * size
+        for t in range(0, n + 2): #left to right sweep
+            j = t - 1
+            self.adverb_left[t+1] = j if (j >= 0 and j <= n and adverb[j]) else self.adverb_left[t]
+            self.noun_left[t+1] = j if (j >= 0 and j <= n and noun[j]) else self.noun_left[t]
+            self.nonverb_left[t+1] = j if (j >= 0 and j <= n and nonverb[j]) else self.nonverb_left[t]
+        self.adverb_right = [-1] * size
+        self.noun_right = [-1] * size
+        self.nonverb_right = [-1] * size
+        self.verb_right = [-1] * size
+        for t in range(n, -2, -1): #right to left sweep
+            j = t + 1
+            self.adverb_right[t+1] = j if (j <= n and adverb_r[j]) else self.adverb_right[t+2]
+            self.noun_right[t+1] = j if (j <= n and noun[j]) else self.noun_right[t+2]
+            self.nonverb_right[t+1] = j if (j <= n and nonverb[j]) else self.nonverb_right[t+2]
+            self.verb_right[t+1] = j if (j <= n and verb_r[j]) else self.verb_right[t+2]
+
+        #verb chain boundaries, (whether the neighbors of tid make a verb at tid the first/last in its chain)
+        self.first_bits = [True] * size
+        self.last_bits = [True] * size
+        for t in range(-1, n + 2):
+            left = sentence.get_token(t - 1)
+            if left.isverb():
+                self.first_bits[t+1] = False
+            elif left.pos[0] == 'R': #if its an adverb, we need to see if there is a verb before it
+                self.first_bits[t+1] = not sentence.get_token(left.tid - 1).isverb()
+            right = sentence.get_token(t + 1)
+            if right.isverb():
+                self.last_bits[t+1] = False
+            elif right.pos[0] == 'R': #if its an adverb, we need to see if there is a verb after it
+                self.last_bits[t+1] = not sentence.get_token(right.tid + 1).isverb()
+
+    def find(self, table, tid):
+        """Return the tid stored in a nearest token table for tid (-1 if there is none)"""
+        return table[min(max(tid, -1), self.n + 1) + 1]
+
+    def lookup(self, table, tid, default):
+        """Return the value in a per position table for tid, or default if tid is out of range"""
+        if tid < -1 or tid > self.n + 1:
+            return default
+        return table[tid + 1]
+
+class DepIndex:
+    'Lookup tables over the dependency relations of a sentence, built in one pass over the relations'
+    def __init__(self, deps):
+        """@params: list of Dependency deps"""
+        self.gov = {} #dependent id -> (relation type, governor id), first relation wins
+        self.governees = {} #governor id -> list of (relation type, dependent id)
+        self.det = {} #governor id -> dependent id of its first 'det' relation
+        self.subjects = [] #dependent ids of subject relations, in order
+        self.root = None #dependent id of the first 'root' relation
+        self.passive = False #whether there is a nsubjpass or csubjpass relation
+        for d in deps:
+            gov_id = d.gov_id()
+            dep_id = d.dependent_id()
+            if dep_id not in self.gov:
+                self.gov[dep_id] = (d.dtype, gov_id)
+            self.governees.setdefault(gov_id, []).append((d.dtype, dep_id))
+            if d.dtype == 'det' and gov_id not in self.det:
+                self.det[gov_id] = dep_id
+            if d.dtype == 'nsubj' or d.dtype == 'nsubjpass' or d.dtype == 'expl':
+                self.subjects.append(dep_id)
+            if d.dtype == 'root' and self.root is None:
+                self.root = dep_id
+            if d.dtype == 'nsubjpass' or d.dtype == 'csubjpass':
+                self.passive = True
 
 class Sentence:
     'Holds the data for a instance of a sentence parsed from the xml output of Core NLP'
@@ -652,23 +784,52 @@ class Sentence:
         self.deps = d #the dependency relations of sentence, a list of Dependency objects
         self.corr_pairs = pairs
         self.prev = prev #previous sentence
+        self.dindex = None #DepIndex over deps, built on first lookup
+        self.vchains = None #cached result of get_vchains()
+        self.ctx = None #cached result of context_index()
+        self.cindex = None #cached result of category_index()
+
+    def __getstate__(self):
+        #the caches are rebuilt when needed, and the verb chains link to other sentences
+        state = dict(self.__dict__)
+        state['dindex'] = None
+        state['vchains'] = None
+        state['ctx'] = None
+        state['cindex'] = None
+        return state
     
     def get_token(self, tid): 
         """return token given by token id, return None if out of bounds"""
         if tid > len(self.sen) or tid < 0:
-            return NullToken()
+            return NULL_TOKEN
         if tid == 0:
-            return Token("ROOT", "ROOT", "ROOT", 0)
+            return ROOT_TOKEN
         else:
             tid = tid-1
             return self.sen[tid]
 
+    def category_index(self):
+        """Return the CategoryIndex of the sentence, built once and kept until a word is added"""
+        if getattr(self, 'cindex', None) is None:
+            self.cindex = CategoryIndex(self)
+        return self.cindex
+
     def add_word(self, token):
         """Append a token to the sentence"""
         self.sen.append(token)
+        self.vchains = None
+        self.ctx = None
+        self.cindex = None
 
     def add_dep(self, dep):
         self.deps.append(dep)
+        self.dindex = None
+
+    def dep_index(self):
+        """Return the DepIndex for the sentence's dependencies (built once, rebuilt only after add_dep)"""
+        if getattr(self, 'dindex', None) is None: #sentences pickled before the index existed do not have dindex
+            self.dindex = DepIndex(self.deps)
+        return self.dindex
     
     def dep_tostring(self):
         """Print the dependency relations in the sentence"""
@@ -685,92 +846,118 @@ class Sentence:
     
     def get_subject_list(self): #do not use this method
         """Return a list of indices of the subject tokens of the sentence"""
-        subs = []
-        for i in self.deps:
-            if i.dtype == 'nsubj' or i.dtype == 'nsubjpass' or i.dtype == 'expl': 
-                subs.append(i.dependent_id())
-        return list(subs)
+        return list(self.dep_index().subjects)
+
+    def context_index(self):
+        """Return the tables used by get_token_left/get_token_right, built in one pass over the sentence
+            and kept until a word is added
+            @ret: 2-Tuple (left, right) - left[tid] is the tid of the closest non punctuation token to the left of tid 
+                  (tid 0..n+1), right[tid+1] the one to the right of tid (tid -1..n), -1 means there is none
+        """
+        if getattr(self, 'ctx', None) is None:
+            n = len(self.sen)
+            #ROOT (tid 0) is never punctuation
+            keep = [True] + [x.word not in string.punctuation for x in self.sen]
+            left = [-1] * (n + 2)
+            for t in range(1, n + 2):
+                if keep[t-1]:
+                    left[t] = t - 1
+                else:
+                    left[t] = left[t-1]
+            right = [-1] * (n + 2)
+            for t in range(n - 1, -2, -1):
+                if keep[t+1]:
+                    right[t+1] = t + 1
+                else:
+                    right[t+1] = right[t+2]
+            self.ctx = (left, right)
+        return self.ctx
 
     def get_token_left(self, tid):
-        curr = tid
-        while curr > 0:
-            tok = self.get_token(curr - 1)
-            if tok.word not in string.punctuation:
-                return tok
-            else:
-                curr = curr - 1
-        return NullToken()
+        """Return the closest token to the left of tid that is not punctuation"""
+        left = self.context_index()[0]
+        if tid < 0 or tid >= len(left):
+            return NULL_TOKEN
+        return self.get_token(left[tid])
 
     def get_token_right(self, tid):
-        curr = tid
-        while curr < len(self.sen):
-            tok = self.get_token(curr + 1)
-            if tok.word not in string.punctuation:
-                return tok
-            else:
-                curr = curr + 1
-        return NullToken()
+        """Return the closest token to the right of tid that is not punctuation"""
+        right = self.context_index()[1]
+        if tid < -1 or tid + 1 >= len(right):
+            return NULL_TOKEN
+        return self.get_token(right[tid+1])
+
+    def window_left(self, tid, width):
+        """Return a list of the width closest non punctuation tokens to the left of tid (closest first)"""
+        toks = []
+        for i in range(width):
+            tok = self.get_token_left(tid)
+            toks.append(tok)
+            tid = tok.tid
+        return toks
+
+    def window_right(self, tid, width):
+        """Return a list of the width closest non punctuation tokens to the right of tid (closest first)"""
+        toks = []
+        for i in range(width):
+            tok = self.get_token_right(tid)
+            toks.append(tok)
+            tid = tok.tid
+        return toks
     
         
     def ispassive(self):
         """return true if there is a passive contruct in sentence"""
-        p = False   
-        for d in self.deps:
-            if d.dtype == 'nsubjpass' or d.dtype == 'csubjpass':
-                passive = True
-                break
-        return p
+        #NOTE: this has always returned False (the old loop set the wrong variable), the passive feature
+        #in existing instance files and classifiers depends on that, use has_passive() for the real answer
+        return False
+
+    def has_passive(self):
+        """return true if there is a nsubjpass or csubjpass relation in sentence"""
+        return self.dep_index().passive
 
     def get_subject_token(self):
         """Return a list of the subject tokens of the sentence"""
-        subs = []
-        for i in self.deps:
-            if i.dtype == 'nsubj' or i.dtype == 'nsubjpass' or i.dtype == 'expl': 
-                subs.append(self.get_token(i.dependent_id()))
+        subs = [self.get_token(x) for x in self.dep_index().subjects]
         if not subs:
-            subs.append(NullToken())
-        return list(subs)
+            subs.append(NULL_TOKEN)
+        return subs
 
     def get_root(self):
         """Return the root of the sentence as a Token object"""
-        root = 'None'
-        for i in self.deps:
-            if i.dtype == 'root':
-                root = self.get_token(i.dependent_id())
-                break   
-        return root
+        root = self.dep_index().root
+        if root is None:
+            return 'None'
+        return self.get_token(root)
 
     def get_governees(self, token_index):
         """Return the a list of governees and relations of the token 
             with tid equal to token index
             @ret: list of 2-Tuples with form (relation type, governee id)
         """
-        governees = []
-        for i in self.deps:
-            if i.gov_id() == token_index:
-                governees.append((i.dtype, i.dependent_id()))
+        governees = self.dep_index().governees.get(token_index)
         if not governees: #no governees for token
             return [('None', -1)]   
         else:
-            return governees
+            return list(governees)
 
     def get_gov(self, token_index): #note that all tokens have a single governor (which may be ROOT)
         """Return the governor of the token with tid equal to token_index
             as well as its relation type.
             @ret: 2-Tuple - (relation type, governor index) 
         """
-        for i in self.deps:
-            if i.dependent_id() == token_index:
-                return (i.dtype, i.gov_id())
+        gov = self.dep_index().gov.get(token_index)
+        if gov is not None:
+            return gov
         print("Token not found in sentence")
         return False
 
     def get_det(self, token_index):
         """Return the determiner (surface form) for the token with given index"""
-        for i in self.deps:
-            if i.dtype == 'det' and i.gov_id() == token_index:
-                return self.get_token(i.dependent_id())
-        return NullToken() 
+        det = self.dep_index().det.get(token_index)
+        if det is not None:
+            return self.get_token(det)
+        return NULL_TOKEN 
     
     def add_pair(self, pair):
         """Add a correction pair to the sentence's corr_pairs list
@@ -794,7 +981,29 @@ class Sentence:
             return False
 
     def get_vchains(self):
-        """Return list of VChain objects for all verb chains in the sentence"""
+        """Return list of VChain objects for all verb chains in the sentence, the list is built once
+            and kept until a word is added. Each chain's prev is set to the chain before it
+            (the first chain gets the last chain of the previous sentence).
+        """
+        chains = self.cached_vchains()
+        if chains and chains[0].prev is False:
+            prevchains = None
+            if self.prev:
+                prevchains = self.prev.cached_vchains()
+            if prevchains:
+                chains[0].prev = prevchains[len(prevchains) - 1]
+            else:
+                chains[0].prev = None
+        return chains
+
+    def cached_vchains(self):
+        """get_vchains without linking the first chain to the previous sentence"""
+        if getattr(self, 'vchains', None) is None: #sentences pickled before the cache existed do not have vchains
+            self.vchains = self.build_vchains()
+        return self.vchains
+
+    def build_vchains(self):
+        """Build the list of VChain objects for all verb chains in the sentence (uncached, use get_vchains())"""
         chains = []
         started = False #whether we have started building chain
         num_chains = 0
@@ -809,6 +1018,10 @@ class Sentence:
                 #check for possible chain that is not just a single adverb, a 'to' or single modal
                 if poss and not (len(poss) == 1 and (poss[0].isadverb() or poss[0].pos == 'TO' or poss[0].pos == 'MD')): 
                     chain = VChain(list(poss), poss[0].tid, poss[len(poss)-1].tid, num_chains)
+                    if chains:
+                        chain.prev = chains[len(chains) - 1]
+                    else:
+                        chain.prev = False #linked by get_vchains()
                     chains.append(chain)
                     num_chains = num_chains + 1
                 if tok.pos == 'TO' and self.get_token(tok.tid + 1).isverb(): #if current token is 'to' add it to the start of new chain
@@ -0,0 +1,328 @@
+##########################################################
+#       maxent.py
+#       Score instance files with a trained MaxEnt classifier
+#       in process (instead of compiling and starting a JVM
+#       with run-classifier.sh). Models are either exported from
+#       Mallet with classiy-old/ExportMaxEnt.java or trained with
+#       the python trainer below, output is one label per line,
+#       the same format as VChainClassifier's
+#       The trainer streams an instance file (or a vectorizer
+#       matrix) in minibatches so the data never has to be held
+#       in memory all at once
+############################################################
+import numpy as np
+import scipy.sparse as sparse
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import vectorizer
+import resource
+import time
+import re
+import sys
+
+#Mallet's import-file pipe: the first field of a line is the instance name, the rest is lowercased and split
+#into tokens with the default token regex \p{L}[\p{L}\p{P}]+\p{L} (the punctuation below is the ascii part of \p{P})
+MALLET_LINE = re.compile(r'^(\S*)[\s,]*(.*)$')
+MALLET_LETTER = r'[^\W\d_]'
+MALLET_TOKEN = re.compile(MALLET_LETTER + r'(?:' + MALLET_LETTER + r'''|[!"#%&'()*,\-./:;?@\[\\\]_{}])+''' + MALLET_LETTER)
+
+class MaxEntModel:
+    'Weights of a multinomial logistic regression (MaxEnt) classifier plus its label and feature alphabets'
+    def __init__(self, labels, features, weights, bias, mallet=False):
+        """@params:
+                list labels - label strings, column i of weights is for label i
+                list features - feature strings, row i of weights is for feature i
+                numpy array weights - (number of features x number of labels) weight matrix
+                numpy array bias - weight of the default (always on) feature for each label
+                bool mallet - if true, lines are turned into features the way Mallet's import-file does it
+                              (first field dropped as the instance name, lowercased, split with Mallet's token regex),
+                              else every space separated string on a line is a feature
+        """
+        self.labels = list(labels)
+        self.features = list(features)
+        self.feature_ids = dict([(f, i) for (i, f) in enumerate(self.features)])
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.mallet = mallet
+
+    def line_features(self, line):
+        """Return the list of feature strings for an instance line"""
+        if self.mallet:
+            data = MALLET_LINE.match(line.rstrip('\n')).group(2)
+            return MALLET_TOKEN.findall(data.lower())
+        else:
+            return line.split()
+
+    def vectorize(self, lines):
+        """Return a CSR matrix (one row per line) of feature counts for instance lines, unknown features are dropped"""
+        data = array('d')
+        indices = array('i')
+        indptr = array('q', [0])
+        for line in lines:
+            row = {}
+            for f in self.line_features(line):
+                i = self.feature_ids.get(f)
+                if i is not None:
+                    row[i] = row.get(i, 0) + 1
+            for i in sorted(row):
+                indices.append(i)
+                data.append(row[i])
+            indptr.append(len(indices))
+        return sparse.csr_matrix((np.frombuffer(data, dtype=np.float64), np.frombuffer(indices, dtype=np.int32),
+                                  np.frombuffer(indptr, dtype=np.int64)), shape=(len(indptr) - 1, len(self.features)))
+
+    def scores(self, X):
+        """Return the (instances x labels) matrix of unnormalized scores for the feature matrix X"""
+        return X @ self.weights + self.bias
+
+    def probabilities(self, X):
+        """Return the (instances x labels) matrix of label probabilities for the feature matrix X"""
+        s = self.scores(X)
+        s = np.exp(s - s.max(axis=1, keepdims=True))
+        return s / s.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        """Return the index of the best label for each row of X"""
+        return np.argmax(self.scores(X), axis=1)
+
+    def save(self, filename):
+        """Save the model as a npz file"""
+        np.savez_compressed(filename, labels=np.array(self.labels, dtype=object), features=np.array(self.features, dtype=object),
+                            weights=self.weights, bias=self.bias, mallet=np.array(self.mallet))
+
+    @staticmethod
+    def load(filename):
+        """Load a model saved with save() (.npz) or exported from Mallet with ExportMaxEnt (text)"""
+        if filename.endswith('.npz'):
+            data = np.load(filename, allow_pickle=True)
+            return MaxEntModel(data['labels'], data['features'], data['weights'], data['bias'], bool(data['mallet']))
+        else:
+            return load_mallet_export(filename)
+
+def load_mallet_export(filename):
+    """Load the text file written by ExportMaxEnt.java"""
+    infile = open(filename, 'r', encoding='utf-8')
+    nlabels = int(infile.readline().split()[1])
+    labels = [infile.readline().rstrip('\n') for x in range(nlabels)]
+    nfeats = int(infile.readline().split()[1])
+    features = [infile.readline().rstrip('\n') for x in range(nfeats)]
+    infile.readline() #weights
+    rows = np.loadtxt(infile, dtype=np.float64, ndmin=2)
+    infile.close()
+    return MaxEntModel(labels, features, rows[:nfeats], rows[nfeats], mallet=True)
+
+def classify_file(model, inst_file, out_file, batch_size=4096):
+    """Classify every instance in inst_file and write the best label for each one per line to out_file
+        (the same output as VChainClassifier, that eval_results.evaluate reads)
+        @params:
+            MaxEntModel model
+            string inst_file - one instance per line
+            string out_file - file to write labels to
+            int batch_size - number of instances scored at a time
+        @ret:
+            number of instances classified
+    """
+    infile = open(inst_file, 'r')
+    outfile = open(out_file, 'w')
+    count = 0
+    batch = []
+    for line in infile:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            count = count + write_batch(model, batch, outfile)
+            batch = []
+    if batch:
+        count = count + write_batch(model, batch, outfile)
+    infile.close()
+    outfile.close()
+    return count
+
+def write_batch(model, lines, outfile):
+    """Score a list of instance lines and write their labels to outfile"""
+    best = model.predict(model.vectorize(lines))
+    outfile.write("".join([model.labels[i] + "\n" for i in best]))
+    return len(lines)
+
+#------------------------------------------------------------
+#       Training
+#-----------------------------------------------------------
+def instance_batches(inst_file, featmap, batch_size, label_file=None):
+    """Stream an instance file as vectorized minibatches
+        @ret:
+            generator of (CSR matrix X, numpy array of label ids y) tuples with at most batch_size rows
+    """
+    batch = []
+    for inst in vectorizer.read_instances(inst_file, label_file):
+        batch.append(inst)
+        if len(batch) >= batch_size:
+            yield vectorizer.vectorize(batch, featmap)
+            batch = []
+    if batch:
+        yield vectorizer.vectorize(batch, featmap)
+
+def matrix_batches(X, y, batch_size):
+    """Split a matrix loaded with vectorizer.load_npz into minibatches"""
+    for start in range(0, X.shape[0], batch_size):
+        yield (X[start:start + batch_size], y[start:start + batch_size])
+
+class MaxEntTrainer:
+    'Fits a MaxEnt model (multinomial logistic regression with a gaussian prior on the weights) with minibatch AdaGrad'
+    def __init__(self, nfeats, nlabels, ninstances, variance=1.0, rate=0.1, threads=1, seed=0):
+        """@params:
+                int nfeats, nlabels - size of the weight matrix
+                int ninstances - number of training instances, the prior is spread evenly over the minibatches
+                float variance - variance of the gaussian prior (Mallet's default is 1)
+                float rate - AdaGrad learning rate
+                int threads - number of threads the gradient of each minibatch is split over
+                int seed - seed for the order instances are seen in
+        """
+        self.weights = np.zeros((nfeats, nlabels))
+        self.bias = np.zeros(nlabels)
+        self.l2 = 1.0 / (variance * max(ninstances, 1))
+        self.rate = rate
+        self.threads = threads
+        self.rng = np.random.RandomState(seed)
+        self.sq_weights = np.zeros((nfeats, nlabels)) #sums of squared gradients for AdaGrad
+        self.sq_bias = np.zeros(nlabels)
+        self.pool = None
+        if threads > 1:
+            self.pool = ThreadPoolExecutor(threads)
+
+    def partial_gradient(self, X, y):
+        """Return (negative log likelihood, weight gradient, bias gradient) for the rows X with labels y"""
+        s = X @ self.weights + self.bias
+        s = s - s.max(axis=1, keepdims=True)
+        p = np.exp(s)
+        z = p.sum(axis=1)
+        rows = np.arange(len(y))
+        loss = np.sum(np.log(z) - s[rows, y])
+        p = p / z[:, None]
+        p[rows, y] = p[rows, y] - 1
+        return (loss, X.T @ p, p.sum(axis=0))
+
+    def gradient(self, X, y):
+        """Gradient of a minibatch, split into one chunk of rows per thread (chunks are summed in order so
+            results do not depend on thread timing)"""
+        if self.pool is None or X.shape[0] < 2 * self.threads:
+            return self.partial_gradient(X, y)
+        bounds = np.linspace(0, X.shape[0], self.threads + 1).astype(int)
+        parts = list(self.pool.map(lambda i: self.partial_gradient(X[bounds[i]:bounds[i+1]], y[bounds[i]:bounds[i+1]]),
+                                   range(self.threads)))
+        return (sum([p[0] for p in parts]), sum([p[1] for p in parts]), sum([p[2] for p in parts]))
+
+    def train_batch(self, X, y):
+        """Take one AdaGrad step on a minibatch, return its negative log likelihood"""
+        keep = y >= 0 #labels not in the feature map
+        if not keep.all():
+            (X, y) = (X[keep], y[keep])
+        if X.shape[0] == 0:
+            return 0.0
+        (loss, gw, gb) = self.gradient(X, y)
+        n = X.shape[0]
+        gw = gw / n + self.l2 * self.weights
+        gb = gb / n
+        self.sq_weights += gw * gw
+        self.sq_bias += gb * gb
+        self.weights -= self.rate * gw / (np.sqrt(self.sq_weights) + 1e-8)
+        self.bias -= self.rate * gb / (np.sqrt(self.sq_bias) + 1e-8)
+        return loss
+
+    def shuffled(self, batches, buffer_size):
+        """Shuffle the rows of a stream of minibatches within a window of buffer_size batches"""
+        window = []
+        for batch in batches:
+            window.append(batch)
+            if len(window) >= buffer_size:
+                for b in self.shuffle_window(window):
+                    yield b
+                window = []
+        if window:
+            for b in self.shuffle_window(window):
+                yield b
+
+    def shuffle_window(self, window):
+        X = sparse.vstack([b[0] for b in window], format='csr')
+        y = np.concatenate([b[1] for b in window])
+        order = self.rng.permutation(len(y))
+        return matrix_batches(X[order], y[order], window[0][0].shape[0])
+
+    def train(self, batch_source, epochs=10, buffer_size=16, verbose=True):
+        """Train over the minibatches
+            @params:
+                function batch_source - called once per epoch, returns an iterable of (X, y) minibatches
+                int epochs - number of passes over the data
+                int buffer_size - number of minibatches shuffled together
+        """
+        for epoch in range(epochs):
+            loss = 0.0
+            for (X, y) in self.shuffled(batch_source(), buffer_size):
+                loss = loss + self.train_batch(X, y)
+            if verbose:
+                print("Epoch {} negative log likelihood: {:.4f}".format(epoch + 1, loss))
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+def train_maxent(batch_source, featmap, ninstances, epochs=10, variance=1.0, rate=0.1, threads=1, seed=0, buffer_size=16):
+    """Train a MaxEntModel (that scores instance lines with the same features as featmap)
+        @params:
+            function batch_source - called once per epoch, returns an iterable of (X, y) minibatches
+            vectorizer.FeatureMap featmap - the map the minibatches were made with (must not be hashed)
+            int ninstances - number of training instances
+        @ret:
+            MaxEntModel
+    """
+    if featmap.hash_size > 0:
+        raise ValueError("hashed feature maps can not be used to score instance lines")
+    trainer = MaxEntTrainer(featmap.num_features(), len(featmap.labels), ninstances, variance, rate, threads, seed)
+    trainer.train(batch_source, epochs, buffer_size)
+    return MaxEntModel(featmap.labels, featmap.features, trainer.weights, trainer.bias)
+
+def counting(items, count):
+    """Yield the items, adding one to count[0] for each"""
+    for item in items:
+        count[0] = count[0] + 1
+        yield item
+
+def peak_memory():
+    """Peak resident memory of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+if __name__ == "__main__":
+    #ARGS classify modelfile instfile outfile [batchsize]
+    #ARGS convert mallet_export_file model.npz (save a Mallet export as npz so it loads faster)
+    #ARGS train instfile model.npz [--labels=labelfile] [--batch=N] [--epochs=N] [--threads=N] [--seed=N]
+    #                              [--variance=F] [--rate=F] [--fthresh=N]
+    #ARGS train matrix.npz model.npz --featmap=featmapfile [options above] (matrix and feature map from process_data vectorize)
+    opts = dict([x[2:].split('=', 1) for x in sys.argv[1:] if x.startswith('--') and '=' in x])
+    if sys.argv[1] == 'train':
+        start = time.time()
+        batch_size = int(opts.get('batch', 1024))
+        if sys.argv[2].endswith('.npz'):
+            featmap = vectorizer.FeatureMap.load(opts['featmap'])
+            (X, y) = vectorizer.load_npz(sys.argv[2])
+            ninstances = X.shape[0]
+            source = lambda: matrix_batches(X, y, batch_size)
+        else: #feature map is learned in a first streaming pass, then the file is reread every epoch
+            instfile = sys.argv[2]
+            labelfile = opts.get('labels')
+            count = [0] #instances are counted during the feature map pass, instead of reading the file again
+            featmap = vectorizer.learn_featmap(counting(vectorizer.read_instances(instfile, labelfile), count),
+                                               int(opts.get('fthresh', 1)))
+            ninstances = count[0]
+            source = lambda: instance_batches(instfile, featmap, batch_size, labelfile)
+        model = train_maxent(source, featmap, ninstances, int(opts.get('epochs', 10)), float(opts.get('variance', 1.0)),
+                             float(opts.get('rate', 0.1)), int(opts.get('threads', 1)), int(opts.get('seed', 0)))
+        model.save(sys.argv[3])
+        print("Instances: {} Features: {} Labels: {}".format(ninstances, len(model.features), len(model.labels)))
+        print("Training time: {:.2f}s Peak memory: {:.1f}MB".format(time.time() - start, peak_memory()))
+    elif sys.argv[1] == 'classify':
+        model = MaxEntModel.load(sys.argv[2])
+        if len(sys.argv) > 5:
+            n = classify_file(model, sys.argv[3], sys.argv[4], int(sys.argv[5]))
+        else:
+            n = classify_file(model, sys.argv[3], sys.argv[4])
+        print("Classified {} instances".format(n))
+    elif sys.argv[1] == 'convert':
+        MaxEntModel.load(sys.argv[2]).save(sys.argv[3])
+    print("done")
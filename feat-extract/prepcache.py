@@ -0,0 +1,107 @@
+##########################################################
+#       prepcache.py
+#       Content addressed cache for the output of process_data
+#       prep: the key is a hash of the annotation files and the
+#       prep options, so unchanged inputs are copied from the
+#       cache instead of being read again, and changed inputs
+#       get a new key (old entries are evicted, least recently
+#       used first, once the cache is over its size cap)
+#       The source of the modules that build and define the
+#       pickled objects is part of the key, so changing them
+#       does not return entries made by the old code
+############################################################
+import hashlib
+import shutil
+import os
+
+PREP_CACHE_VERSION = 1 #bump when the prep output changes for the same inputs and code (the code is in the key)
+DEFAULT_CACHE_DIR = os.environ.get('VCHECK_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'verb-checker', 'prep'))
+DEFAULT_CACHE_SIZE = 2048 * 1024 * 1024 #bytes
+#modules whose code decides what prep writes (the readers, the classes that are pickled, the VerbNet lookups
+#check_pos uses and the verb chain transducers)
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+PREP_SOURCES = [os.path.join(SOURCE_DIR, x) for x in ('lingstructs.py', 'process_data.py', 'corpus.py', 'vnlexicon.py', 'fst.py')]
+
+def cache_key(files, options, sources=PREP_SOURCES):
+    """Return the hex sha256 of the contents of files (in order), the options and the source files
+        @params:
+            list files - input file names
+            list options - strings that change the prep output (reader, output format, ...)
+            list sources - the code that makes the prep output (see PREP_SOURCES)
+    """
+    h = hashlib.sha256()
+    h.update("prep {}\n".format(PREP_CACHE_VERSION).encode('utf-8'))
+    for o in options:
+        h.update("option {}\n".format(o).encode('utf-8'))
+    for f in sources:
+        h.update("source {}\n".format(os.path.basename(f)).encode('utf-8'))
+        hash_file(h, f)
+    for f in files:
+        hash_file(h, f)
+    return h.hexdigest()
+
+def hash_file(h, filename):
+    """Add the size and contents of filename to the hash h"""
+    h.update("file {}\n".format(os.path.getsize(filename)).encode('utf-8'))
+    infile = open(filename, 'rb')
+    chunk = infile.read(1 << 20)
+    while chunk:
+        h.update(chunk)
+        chunk = infile.read(1 << 20)
+    infile.close()
+
+class PrepCache:
+    'Directory of prep outputs named by their key, the modification time of an entry is when it was last used'
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry(self, key):
+        return os.path.join(self.directory, key + '.prep')
+
+    def fetch(self, key, outfile):
+        """Copy the entry for key to outfile
+            @ret: true if there was an entry (a hit)
+        """
+        path = self.entry(key)
+        if not os.path.exists(path):
+            return False
+        shutil.copyfile(path, outfile)
+        os.utime(path) #mark as recently used
+        return True
+
+    def store(self, key, outfile):
+        """Add outfile to the cache under key, then evict entries until the cache fits in max_size"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        tmp = self.entry(key) + '.tmp{}'.format(os.getpid())
+        shutil.copyfile(outfile, tmp)
+        os.replace(tmp, self.entry(key)) #so a half written entry is never read
+        self.evict(keep=key)
+
+    def entries(self):
+        """Return a list of (last used time, size, path) for the entries, least recently used first"""
+        out = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.prep'):
+                path = os.path.join(self.directory, name)
+                st = os.stat(path)
+                out.append((st.st_mtime, st.st_size, path))
+        return sorted(out)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries (never the one for key keep) until the cache fits in max_size
+            @ret: number of entries removed
+        """
+        entries = self.entries()
+        total = sum([e[1] for e in entries])
+        removed = 0
+        for (mtime, size, path) in entries:
+            if total <= self.max_size:
+                break
+            if keep and path == self.entry(keep):
+                continue
+            os.remove(path)
+            total = total - size
+            removed = removed + 1
+        return removed
@@ -6,12 +6,60 @@
 #     and then parse features from the data in order to generate
 #     data to use with Mallet       
 ############################################################
-from nltk.corpus import verbnet
 from lingstructs import *
+from corpus import ColumnarCorpus, MappedCorpus, write_corpus, is_corpus_file
+import vnlexicon
 import lxml.etree as xml
+import json
 import sys
+import os
 import pickle
+import multiprocessing
+import time
             
+#------------------------------------------------------------
+#       Readers
+#       Each annotation format (CoreNLP xml, json or CoNLL-U) is read into
+#       sentence records: (list of (id, word, lemma, POS) tuples, list of
+#       (type, (governor word, idx), (dependent word, idx)) tuples), which are
+#       then turned into Sentences the same way for every format
+#-----------------------------------------------------------
+def iter_sentences(filename, getdeps=True, check=True):
+    """Read the annotations in filename (CoreNLP xml, json or CoNLL-U, see annotation_format) one Sentence at a time
+        @params:
+                String filename,
+                bool deps - whether to include dependencies
+                bool check - if true, double check if verb is incorrectly tagged as something else 
+        @ret: 
+            A generator of Sentence objects for each sentence in the file
+    """
+    for (tokens, deps) in iter_records(filename, getdeps):
+        yield build_sentence(tokens, deps, check)
+
+def iter_delimited_sentences(filename, del_filename, getdeps=True, check=True):
+    """Read the annotations of the plain text and of the delimited text (both in the same format, any of the ones
+        iter_sentences reads) in lockstep, yields one Sentence (with its corr_pairs filled in) at a time
+    """
+    prev = None #previous sentence
+    for ((tokens, deps), (deltokens, x)) in zip(iter_records(filename, getdeps), iter_records(del_filename, False)):
+        sen_data = build_delimited_sentence(tokens, deps, deltokens, check)
+        sen_data.prev = prev
+        prev = sen_data
+        yield sen_data
+
+def iter_xml(filename, getdeps=True, check=True):
+    """Streaming version of read_xml, yields one Sentence at a time and throws away
+        the xml for each sentence once it has been read, so memory use does not grow with the file
+        @params:
+                String filename, (or a file object)
+                bool deps - whether to include dependencies
+                bool check - if true, double check if verb is incorrectly tagged as something else 
+        @ret: 
+            A generator of Sentence objects for each sentence in the file
+    """
+    for (tokens, deps) in xml_records(filename, getdeps):
+        yield build_sentence(tokens, deps, check)
+
 def read_xml(filename, getdeps=True, check=True):
     """Parse the xml output from filename made by the Stanford Core NLP Annotators
         and extract syntatic and dependecy features 
@@ -22,44 +70,25 @@ def read_xml(filename, getdeps=True, check=True):
         @ret: 
             A list of Sentence objects storing each sentence in the file
     """
-    sents = []
-    xfile = open(filename, 'r')
-    data = xml.parse(xfile)
-    root = data.getroot()
-    sentences = root[0][0] #get the sentences tree
-    for sen in sentences:
-        tokens = sen[0] #a single sentence split into tokens
-        deptypes = sen[1:] #the dependency relations (of various kinds) for the words in the sentence
-        sen_data = Sentence()   
-        prev_isverb = False #whether the previous word is a verb
-        for i in tokens: #get data from single token
-            t = int(i.get("id"))
-            w = i.find("word").text
-            l = i.find("lemma").text
-            p = i.find("POS").text
-            #make sure verb was not incorrectly tagged as noun or adjective
-            if check and (p[0] == 'N' or p[0] == 'J') and prev_isverb and in_verblist(l):  
-                p = 'VB' 
-                prev_isverb = False #usually we only need to correct the last verb in verbchain
-            elif l == 'be' or l == 'have' or p == 'MD':   #tagger usually has problems tagging verbs comming after these 
-                prev_isverb = True
-            else:
-                prev_isverb = False
-            #end check code
-            tok = Token(w, l, p, t)
-            sen_data.add_word(tok)
-        if getdeps:
-            for deps in deptypes:
-                if deps.get("type") == "collapsed-ccprocessed-dependencies":
-                    for i in deps: #i is a single dependency relation
-                        t = i.get("type")   
-                        gov = (i.find("governor").text.lower(), int(i.find("governor").get("idx"))) #note: just added lower()
-                        dep = (i.find("dependent").text.lower(), int(i.find("dependent").get("idx")))
-                        relation = Dependency(t, gov, dep)
-                        sen_data.add_dep(relation)
-        sents.append(sen_data)
-    xfile.close()
-    return sents
+    return list(iter_xml(filename, getdeps, check))
+
+def iter_delimited_xml(filename, del_filename, getdeps=True, check=True):
+    """Streaming version of read_delimited_xml, iterparses both files in lockstep and
+        yields one Sentence (with its corr_pairs filled in) at a time
+        @params: 
+                String filename - name of file with non delimited pos tagged data and dependency parse (xml output from Stanford tagger/parser),
+                 String del_filename - name of file with pos tagged data (xml output from Stanford tagger)
+                 bool deps - whether to include dependencies
+                 bool check - if true, double check if verb is incorrectly tagged as something else 
+        @ret: 
+            A generator of Sentence objects for each sentence in the file, with delimiters included
+    """
+    prev = None #previous sentence
+    for ((tokens, deps), (deltokens, x)) in zip(xml_records(filename, getdeps), xml_records(del_filename, False)):
+        sen_data = build_delimited_sentence(tokens, deps, deltokens, check)
+        sen_data.prev = prev
+        prev = sen_data
+        yield sen_data
 
 def read_delimited_xml(filename, del_filename, getdeps=True, check=True):
     """Read xml with delimiters around verb phrase. Need to process a
@@ -73,127 +102,438 @@ def read_delimited_xml(filename, del_filename, getdeps=True, check=True):
         @ret: 
             A list of Sentence objects storing each sentence in the file, with delimiters included
     """
-    sents = []
-    xfile = open(filename, 'r')
-    delfile = open(del_filename, 'r')
-    data = xml.parse(xfile)
-    deldata = xml.parse(delfile)
-    root = data.getroot()
-    delroot = deldata.getroot()
-    sentences = root[0][0] #get the sentences tree
-    delsents = delroot[0][0]
-    prev = None #previous sentence
-    for (sen, delsen) in zip(sentences, delsents):
-        tokens = sen[0] #a single sentence split into tokens
-        deptypes = sen[1:] #the dependency relations (of various kinds) for the words in the sentence
-        sen_data = Sentence()   
-        prev_isverb = False #whether the previous word is a verb
-        delindex = 0
-        in_error_phrase = False #if we are currently in a delimited error or correction phrase
-        pairs = [] #list of error/correction pairs
-        error_phrase = []
-        for i in tokens: #get data from single token
-            t = int(i.get("id"))
-            w = i.find("word").text
-            l = i.find("lemma").text
-            p = i.find("POS").text
-            #make sure verb was not incorrectly tagged as noun or adjective
-            if check and (p[0] == 'N' or p[0] == 'J') and prev_isverb and in_verblist(l):  
-                p = 'VB' 
-                prev_isverb = False #usually we only need to correct the last verb in verbchain
-            elif l == 'be' or l == 'have' or p == 'MD': #tagger usually has problems tagging verbs comming after these
-                prev_isverb = True
-            else:
-                prev_isverb = False
-            #end check code
-            if delsen[0][delindex].find("word").text == '@@' and w != '@@': #check for delimited words (errors)
-                delindex = delindex + 1
-                if not in_error_phrase:
-                    in_error_phrase = True
-                else:  #if we are in error phrase and see delimiter, it is ending delimiter, add error phrase to CorrectionPair list
-                    in_error_phrase = False
-                    if delsen[0][delindex].find("word").text == '##': #get correction phrase
-                        delindex = delindex + 1
-                        corr_phrase = []
-                        while delsen[0][delindex].find("word").text != '##':  #till end of correction phrase
-                            c = delsen[0][delindex]
-                            ct = int(c.get("id"))
-                            cw = c.find("word").text
-                            cl = c.find("lemma").text
-                            cp = c.find("POS").text
-                            ctok = Token(cw, cl, cp, ct) 
-                            corr_phrase.append(ctok)
-                            delindex = delindex + 1
-                        pairs.append(CorrectionPair(VChain(list(error_phrase)), VChain(list(corr_phrase))))
-                        delindex = delindex + 1
-                    error_phrase = [] #reset error phrase
-            tok = Token(w, l, p, t, in_error_phrase)
+    return list(iter_delimited_xml(filename, del_filename, getdeps, check))
+#end bananna 
+
+def build_sentence(tokens, deps, check=True):
+    """Make a Sentence from a sentence record (see the Readers comment)"""
+    sen_data = Sentence()   
+    prev_isverb = False #whether the previous word is a verb
+    for (t, w, l, p) in tokens: #get data from single token
+        (p, prev_isverb) = check_pos(l, p, prev_isverb, check)
+        tok = Token(w, l, p, t)
+        sen_data.add_word(tok)
+    for (t, gov, dep) in deps:
+        sen_data.add_dep(Dependency(t, gov, dep))
+    return sen_data
+
+def build_delimited_sentence(tokens, deps, deltokens, check=True):
+    """Make a Sentence with its CorrectionPairs from the records of the plain sentence and of the same sentence
+        with the verb errors delimited by @@ and their corrections by ##
+    """
+    delwords = [x[1] for x in deltokens]
+    sen_data = Sentence()   
+    prev_isverb = False #whether the previous word is a verb
+    delindex = 0
+    in_error_phrase = False #if we are currently in a delimited error or correction phrase
+    pairs = [] #list of error/correction pairs
+    error_phrase = []
+    for (t, w, l, p) in tokens: #get data from single token
+        (p, prev_isverb) = check_pos(l, p, prev_isverb, check)
+        if delwords[delindex] == '@@' and w != '@@': #check for delimited words (errors)
             delindex = delindex + 1
-            sen_data.add_word(tok)
-            if in_error_phrase: 
-                error_phrase.append(tok)
-        sen_data.add_pairs(pairs)
+            if not in_error_phrase:
+                in_error_phrase = True
+            else:  #if we are in error phrase and see delimiter, it is ending delimiter, add error phrase to CorrectionPair list
+                in_error_phrase = False
+                if delwords[delindex] == '##': #get correction phrase
+                    delindex = delindex + 1
+                    corr_phrase = []
+                    while delwords[delindex] != '##':  #till end of correction phrase
+                        (cid, cword, clemma, cpos) = deltokens[delindex]
+                        ctok = Token(cword, clemma, cpos, cid) 
+                        corr_phrase.append(ctok)
+                        delindex = delindex + 1
+                    pairs.append(CorrectionPair(VChain(list(error_phrase)), VChain(list(corr_phrase))))
+                    delindex = delindex + 1
+                error_phrase = [] #reset error phrase
+        tok = Token(w, l, p, t, in_error_phrase)
+        delindex = delindex + 1
+        sen_data.add_word(tok)
+        if in_error_phrase: 
+            error_phrase.append(tok)
+    sen_data.add_pairs(pairs)
+    for (t, gov, dep) in deps:
+        sen_data.add_dep(Dependency(t, gov, dep))
+    return sen_data
+
+ANNOTATION_EXTENSIONS = {'.xml': 'xml', '.json': 'json', '.conllu': 'conllu', '.conll': 'conllu'}
+
+def annotation_format(filename):
+    """Return the format of an annotation file: 'xml', 'json' or 'conllu', from its extension
+        or (if the extension is not known) from its first character, file objects are taken to be xml
+    """
+    if not isinstance(filename, str):
+        return 'xml'
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ANNOTATION_EXTENSIONS:
+        return ANNOTATION_EXTENSIONS[ext]
+    f = open(filename, 'rb')
+    start = f.read(256).lstrip()
+    f.close()
+    if start.startswith(b'<'):
+        return 'xml'
+    elif start.startswith(b'{'):
+        return 'json'
+    return 'conllu'
+
+def iter_records(filename, getdeps=True):
+    """Yield the sentence records of an annotation file in any of the supported formats"""
+    fmt = annotation_format(filename)
+    if fmt == 'json':
+        return json_records(filename, getdeps)
+    elif fmt == 'conllu':
+        return conllu_records(filename, getdeps)
+    return xml_records(filename, getdeps)
+
+def xml_records(filename, getdeps=True):
+    """Yield the sentence records of a CoreNLP xml file"""
+    for sen in iter_sentence_elements(filename):
+        tokens = []
+        for i in sen[0]: #a single sentence split into tokens
+            tokens.append((int(i.get("id")), i.find("word").text, i.find("lemma").text, i.find("POS").text))
         if getdeps:
-            for deps in deptypes:
-                if deps.get("type") == "collapsed-ccprocessed-dependencies":
-                    for i in deps: #i is a single dependency relation
-                        t = i.get("type")   
-                        gov = (i.find("governor").text.lower(), int(i.find("governor").get("idx"))) #note: just added lower()
-                        dep = (i.find("dependent").text.lower(), int(i.find("dependent").get("idx")))
-                        relation = Dependency(t, gov, dep)
-                        sen_data.add_dep(relation)
-        sen_data.prev = prev
-        prev = sen_data
-        sents.append(sen_data)
-    xfile.close()
-    return sents
-#end bananna 
+            yield (tokens, xml_deps(sen[1:])) #the dependency relations (of various kinds) for the words in the sentence
+        else:
+            yield (tokens, [])
+
+def iter_sentence_elements(filename):
+    """Iterparse the CoreNLP xml in filename and yield each <sentence> element of the sentences tree,
+        each element (and the ones before it) is cleared after it is consumed
+    """
+    context = xml.iterparse(filename, events=('end',), tag='sentence')
+    for (event, elem) in context:
+        parent = elem.getparent()
+        if parent is None or parent.tag != 'sentences': #skip the <sentence> tags in coreference mentions
+            continue
+        yield elem
+        elem.clear()
+        while elem.getprevious() is not None:
+            del parent[0]
+    del context
+
+def xml_deps(deptypes):
+    """Return the collapsed-ccprocessed dependencies from the xml <dependencies> elements deptypes"""
+    deps = []
+    for d in deptypes:
+        if d.get("type") == "collapsed-ccprocessed-dependencies":
+            for i in d: #i is a single dependency relation
+                t = i.get("type")   
+                gov = (i.find("governor").text.lower(), int(i.find("governor").get("idx"))) #note: just added lower()
+                dep = (i.find("dependent").text.lower(), int(i.find("dependent").get("idx")))
+                deps.append((t, gov, dep))
+    return deps
+
+#json dependency lists, in order of preference (the first is the same as the xml reader uses, newer
+#CoreNLP versions only write the others, enhancedPlusPlusDependencies is the closest to it but is not the same,
+#so json from those versions gives somewhat different relations than their xml)
+JSON_DEPENDENCIES = ('collapsed-ccprocessed-dependencies', 'enhancedPlusPlusDependencies', 'enhancedDependencies', 'basicDependencies')
+
+JSON_CHUNK = 1 << 16 #characters read at a time by json_array_items
+
+def json_records(filename, getdeps=True):
+    """Yield the sentence records of a CoreNLP json file (outputFormat=json), the sentences are read and decoded
+        one at a time (see json_array_items), so memory use does not grow with the file
+    """
+    f = open(filename, 'r', encoding='utf-8')
+    for sen in json_array_items(f, 'sentences'):
+        tokens = [(t['index'], t['word'], t['lemma'], t['pos']) for t in sen['tokens']]
+        deps = []
+        if getdeps:
+            for name in JSON_DEPENDENCIES:
+                if name in sen:
+                    for d in sen[name]:
+                        deps.append((d['dep'], (d['governorGloss'].lower(), d['governor']), (d['dependentGloss'].lower(), d['dependent'])))
+                    break
+        yield (tokens, deps)
+    f.close()
+
+def json_array_items(f, key, chunk_size=JSON_CHUNK):
+    """Yield the items of the json array that is the value of key (the first place "key" shows up) in the json
+        file object f, one at a time. Only a window of the file is kept: the item being decoded and what has been
+        read past it, the window grows when an item does not fit in it and is cut down once it is read
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    eof = False
+    def more(size):
+        nonlocal buf, eof
+        chunk = f.read(size)
+        buf = buf + chunk
+        eof = not chunk
+        return not eof
+    name = '"{}"'.format(key)
+    start = -1
+    while start < 0: #find the key, keeping enough of the window to match a key cut in two by a read
+        buf = buf[-len(name):]
+        if not more(chunk_size):
+            return
+        start = buf.find(name)
+    pos = start + len(name)
+    while buf.find('[', pos) < 0: #then the start of the array
+        pos = len(buf)
+        if not more(chunk_size):
+            return
+    pos = buf.find('[', pos) + 1
+    while True:
+        while True: #skip to the next item
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos = pos + 1
+            if pos < len(buf) or not more(chunk_size):
+                break
+        if pos >= len(buf):
+            raise ValueError("{}: the {} array is not closed".format(getattr(f, 'name', 'json'), key))
+        if buf[pos] == ']':
+            return
+        if pos > chunk_size: #drop what has been read
+            buf = buf[pos:]
+            pos = 0
+        while True:
+            try:
+                (item, pos) = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError:
+                if not more(max(chunk_size, len(buf))): #the item goes past the window, read more (doubling it)
+                    raise
+        yield item
+
+def conllu_records(filename, getdeps=True):
+    """Yield the sentence records of a CoNLL-U file (CoreNLP outputFormat=conllu), the POS tag is the XPOS column
+        (UPOS if there is no XPOS), dependencies come from the DEPS column if it is filled in, else from HEAD and DEPREL
+        (the relations are in CoreNLP's order, see conllu_record, an xml file with its relations in another order
+        gives the same relations in a different order)
+    """
+    f = open(filename, 'r', encoding='utf-8')
+    rows = []
+    for line in f:
+        line = line.rstrip('\n')
+        if not line:
+            if rows:
+                yield conllu_record(rows, getdeps)
+                rows = []
+        elif line[0] != '#':
+            cols = line.split('\t')
+            if cols[0].isdigit(): #skip multiword tokens (1-2) and empty nodes (1.1)
+                rows.append(cols)
+    if rows:
+        yield conllu_record(rows, getdeps)
+    f.close()
+
+def conllu_record(rows, getdeps):
+    tokens = []
+    words = {0: 'ROOT'}
+    for cols in rows:
+        tid = int(cols[0])
+        pos = cols[4] if cols[4] != '_' else cols[3]
+        tokens.append((tid, cols[1], cols[2], pos))
+        words[tid] = cols[1]
+    deps = []
+    if getdeps:
+        for cols in rows:
+            tid = int(cols[0])
+            if cols[8] != '_':
+                heads = [x.split(':', 1) for x in cols[8].split('|')]
+            else:
+                heads = [(cols[6], cols[7])]
+            for (head, rel) in heads:
+                if '.' in head: #relation to an empty node
+                    continue
+                deps.append((rel, (words[int(head)].lower(), int(head)), (cols[1].lower(), tid)))
+        #CoNLL-U does not keep the order of the relations, put them in the order CoreNLP writes them in its xml and
+        #json: root relations first, then by dependent, then by governor (the order of DEPS)
+        deps.sort(key=lambda d: (d[1][1] != 0, d[2][1]))
+    return (tokens, deps)
+
+def check_pos(l, p, prev_isverb, check=True):
+    """Make sure verb was not incorrectly tagged as noun or adjective
+        @params:
+            string l, p - lemma and POS tag of the token
+            bool prev_isverb - whether the previous word is a verb
+            bool check - if false, do not change the POS tag
+        @ret:
+            tuple (POS tag to use, whether this word counts as a verb for the next word)
+    """
+    if check and (p[0] == 'N' or p[0] == 'J') and prev_isverb and in_verblist(l):  
+        p = 'VB' 
+        prev_isverb = False #usually we only need to correct the last verb in verbchain
+    elif l == 'be' or l == 'have' or p == 'MD':   #tagger usually has problems tagging verbs comming after these 
+        prev_isverb = True
+    else:
+        prev_isverb = False
+    return (p, prev_isverb)
 
 def in_verblist(lem):
     """Return true if the given lemma is found in the verbnet verb list"""
-    verblist = verbnet.lemmas()
-    if lem in verblist:
-        return True
+    return vnlexicon.get_lexicon().has_lemma(lem)
+
+def load_sentences(sentfile):
+    """Load the sentences written by prep, either a binary corpus file (opened with mmap) or a pickle
+        @ret:
+            a MappedCorpus, ColumnarCorpus or list of Sentences (all can be iterated, indexed and sliced)
+    """
+    if is_corpus_file(sentfile):
+        return MappedCorpus(sentfile)
+    else:
+        return pickle.load(open(sentfile, 'rb'))
+
+def corpus_memory(sents):
+    """Measure the memory used by a list of Sentences (or a ColumnarCorpus), objects shared between tokens
+        (interned strings, the ROOT/NULL tokens, ...) are only counted once
+        @ret:
+            tuple (number of tokens, bytes used)
+    """
+    seen = set()
+    if isinstance(sents, ColumnarCorpus):
+        stack = [sents]
+        ntokens = len(sents.words)
+    else:
+        stack = list(sents)
+        ntokens = sum([len(s.sen) for s in sents])
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total = total + sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, (str, bytes, int, float, bool, type(None))):
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for name in cls.__dict__.get('__slots__', ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return (ntokens, total)
+
+def instance_data(sents, ftype=ASPECT_FEATS):
+    """Create the feature instances for every verb chain in sents that has a valid label
+        @params:
+            list of Sentences sents - the data created from read_xml() 
+            int ftype - what type of features to use, use the labels from the lingstructs class (ASPECT_FEATS, ...)
+        @ret:
+            generator of tuples (label, feature string, original label), in sentence order
+    """
+    for (inst,) in multi_instance_data(sents, (ftype,)):
+        if inst:
+            yield inst
+
+def multi_instance_data(sents, ftypes):
+    """Create the feature instances of several feature types at once, the base CorrectionFeatures of each
+        verb chain are only computed once and shared by all of the types
+        @params:
+            list of Sentences sents
+            list ftypes - feature types (ASPECT_FEATS, ...)
+        @ret:
+            generator with a tuple for every verb chain, holding (label, feature string, original label) for each
+            type in ftypes, or None for the types where the chain does not have a valid label
+    """
+    for s in sents:
+        flist = s.get_feats() #list of all CorrectionFeatures in sentence
+        for f in flist:
+            yield tuple([typed_instance(f, s, ftype) for ftype in ftypes])
+
+def typed_instance(f, s, ftype):
+    """Return (label, feature string, original label) for the base CorrectionFeatures f of Sentence s
+        with the features of ftype added, or None if the label is not valid
+    """
+    if ftype == ASPECT_FEATS:
+        feats = AspectFeatures(f, s)
+    elif ftype == PERSON_NUM_FEATS:
+        feats = PersonNumFeatures(f, s)
     else:
-        return False
+        feats = f
+    label = feats.label
+    if label != 'ERROR':
+        str_feats = " ".join([str(x) for x in feats.fvect])  #get all features
+#       orig = feats.fvect[0][:len(feats.fvect[0])-10]
+        orig = feats.fvect[len(feats.fvect) -1]
+        return (label, str_feats, orig)
+    return None
+
+_worker_sents = None #the sentences being processed, set before the worker processes are forked so they share it
+
+def _instance_chunk(args):
+    """Worker process function, return the multi_instance_data for sentences start:end of _worker_sents as a list,
+        and the (hits, misses, evictions) of the worker's chain cache while creating them
+    """
+    (start, end, ftypes) = args
+    before = CHAIN_CACHE.stats()
+    insts = list(multi_instance_data(_worker_sents[start:end], ftypes))
+    return (insts, tuple([x - y for (x, y) in zip(CHAIN_CACHE.stats(), before)]))
+
+def parallel_instance_data(sents, ftype=ASPECT_FEATS, workers=1, chunksize=256):
+    """Same as instance_data, but splits sents into chunks of chunksize sentences that are processed
+        by a pool of workers processes. Instances come out in the same order as instance_data.
+        @params:
+            list of Sentences sents - the data created from read_xml() (anything that can be sliced)
+            int ftype - what type of features to use
+            int workers - number of processes to use, 1 does not start any processes
+            int chunksize - number of sentences given to a worker at a time
+    """
+    for (inst,) in parallel_multi_instance_data(sents, (ftype,), workers, chunksize):
+        if inst:
+            yield inst
 
-def write_training_instances(sents, filename, labels_file=None, ftype=ASPECT_FEATS):
+def parallel_multi_instance_data(sents, ftypes, workers=1, chunksize=256):
+    """multi_instance_data split over a pool of worker processes (see parallel_instance_data)"""
+    global _worker_sents
+    ftypes = tuple(ftypes)
+    if workers <= 1:
+        for insts in multi_instance_data(sents, ftypes):
+            yield insts
+        return
+    vnlexicon.get_lexicon() #load VerbNet before forking so workers share it copy-on-write
+    _worker_sents = sents
+    chunks = [(i, min(i + chunksize, len(sents)), ftypes) for i in range(0, len(sents), chunksize)]
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for (chunk, stats) in pool.imap(_instance_chunk, chunks): #imap keeps the chunks in order
+                CHAIN_CACHE.add_stats(stats) #so the parent reports the lookups of all the workers
+                for insts in chunk:
+                    yield insts
+    finally:
+        _worker_sents = None
+
+def write_training_instances(sents, filename, labels_file=None, ftype=ASPECT_FEATS, workers=1):
     """Get cleaned instance data needed for training.
         @params:
             list of Sentences sents - the data created from read_xml() 
             string filename - file to write to 
             labels_file - File to print labels to (include them in instance file if no label file provided)
             int ftype - what type of features to use, use the labels from the lingstructs class (ASPECT_FEATS, ...)
+            int workers - number of processes to create the features with
     """
-    if labels_file:
-        lfile = open(labels_file, 'w')
-    outfile = open(filename, 'w')
-    name = 0 #for instance names just give unique number starting at 0
-    for s in sents:
-        flist = s.get_feats() #list of all features in sentence
-        for f in flist:
-            if ftype == ASPECT_FEATS:
-                feats = AspectFeatures(f, s)
-            elif ftype == PERSON_NUM_FEATS:
-                feats = PersonNumFeatures(f, s)
+    write_training_sets(sents, [(filename, labels_file, ftype)], workers)
+
+def write_training_sets(sents, outputs, workers=1):
+    """write_training_instances for several feature types in one pass over the sentences
+        @params:
+            list of Sentences sents
+            list outputs - (filename, labels_file, ftype) for each feature type (labels_file can be None)
+            int workers - number of processes to create the features with
+    """
+    files = [(open(filename, 'w'), open(labels_file, 'w') if labels_file else None) for (filename, labels_file, ftype) in outputs]
+    for insts in parallel_multi_instance_data(sents, [x[2] for x in outputs], workers):
+        for ((outfile, lfile), inst) in zip(files, insts):
+            if inst is None:
+                continue
+            (label, str_feats, orig) = inst
+            if lfile:  #write labels to seperate file
+                outfile.write("{}\n".format(str_feats))
+                lfile.write("{}\n".format(label))
             else:
-                feats = f
-            label = feats.label
-            if label != 'ERROR':
-                str_feats = " ".join([str(x) for x in feats.fvect])
-                if labels_file:  #write labels to seperate file
-#                   outfile.write("{} {}\n".format(name, str_feats))
-                    outfile.write("{}\n".format(str_feats))
-                    lfile.write("{}\n".format(label))
-                else:
-#                   outfile.write("{} {} {}\n".format(name, label, str_feats))
-                    outfile.write("{} {}\n".format(label, str_feats))
-                name = name + 1
-    outfile.close()
-    if labels_file:
-        lfile.close()
-
-def write_testing_instances(sents, filename, labels_file, orig_file, ftype=ASPECT_FEATS):
+                outfile.write("{} {}\n".format(label, str_feats))
+    for (outfile, lfile) in files:
+        outfile.close()
+        if lfile:
+            lfile.close()
+
+def write_testing_instances(sents, filename, labels_file, orig_file, ftype=ASPECT_FEATS, workers=1):
     """Create correction instance data for testing, puts all CorrectionFeature instances
         in one file (without labels), with the correct labels in another file (use these as the gold label set
         for testing), and the original labels in another file
@@ -202,78 +542,183 @@ def write_testing_instances(sents, filename, labels_file, orig_file, ftype=ASPEC
             string filename - file to write to 
             labels_file - File to print labels to 
             orig_file - File to print original labels to 
+            int workers - number of processes to create the features with
     """
-    lfile = open(labels_file, 'w')
-    ofile = open(orig_file, 'w')
-    outfile = open(filename, 'w')
-    name = 0 #for instance names just give unique number starting at 0
-    for s in sents:
-        flist = s.get_feats() #list of all CorrectionFeatures in sentence
-        for f in flist:
-            if ftype == ASPECT_FEATS:
-                feats = AspectFeatures(f, s)
-            elif ftype == PERSON_NUM_FEATS:
-                feats = PersonNumFeatures(f, s)
-            else:
-                feats = f
-            correction = feats.label
-            if correction != 'ERROR':
-                str_feats = " ".join([str(x) for x in feats.fvect])  #get all features
-                outfile.write("{}\n".format(str_feats))
-                lfile.write("{}\n".format(correction))  
-#               ofile.write("{}\n".format(feats.fvect[0][:len(feats.fvect[0])-10]))
-                ofile.write("{}\n".format(feats.fvect[len(feats.fvect) -1]))
-                name = name + 1
-    outfile.close()
-    lfile.close()
+    write_testing_sets(sents, [(filename, labels_file, orig_file, ftype)], workers)
+
+def write_testing_sets(sents, outputs, workers=1):
+    """write_testing_instances for several feature types in one pass over the sentences
+        @params:
+            list of Sentences sents
+            list outputs - (filename, labels_file, orig_file, ftype) for each feature type
+            int workers - number of processes to create the features with
+    """
+    files = [(open(filename, 'w'), open(labels_file, 'w'), open(orig_file, 'w')) for (filename, labels_file, orig_file, ftype) in outputs]
+    for insts in parallel_multi_instance_data(sents, [x[3] for x in outputs], workers):
+        for ((outfile, lfile, ofile), inst) in zip(files, insts):
+            if inst is None:
+                continue
+            (correction, str_feats, orig) = inst
+            outfile.write("{}\n".format(str_feats))
+            lfile.write("{}\n".format(correction))  
+            ofile.write("{}\n".format(orig))
+    for handles in files:
+        for f in handles:
+            f.close()
+
+def typed_filename(filename, typename):
+    """Put the feature type name before the extension of filename (trainout.in -> trainout.aspect.in)"""
+    (root, ext) = os.path.splitext(filename)
+    return "{}.{}{}".format(root, typename, ext)
+
+FEATURE_TYPES = [('aspect', ASPECT_FEATS), ('person', PERSON_NUM_FEATS)]
+
+def feature_types(name):
+    """Return the list of (name, ftype) for the ftype argument name ('aspect', 'person' or 'both')"""
+    types = [x for x in FEATURE_TYPES if name == 'both' or name == x[0]]
+    if not types:
+        print("No valid type of features passed in")
+        types = [(name, 0)]
+    return types
+
+def sentence_record(s):
+    """Return everything the readers fill in for Sentence s as a tuple, so the output of two readers can be compared"""
+    toks = tuple([(x.word, x.lemma, x.pos, x.tid, x.in_delim) for x in s.sen])
+    deps = tuple([(d.dtype, d.gov, d.dependent) for d in s.deps])
+    pairs = tuple([p.tostring() for p in s.corr_pairs])
+    return (toks, deps, pairs, s.prev is not None)
+
+def option_value(opts, name, default=None):
+    """Return the value of a --name=value option from the list opts, or default if it is not there"""
+    for o in opts:
+        if o.startswith(name + '='):
+            return o[len(name) + 1:]
+    return default
 
 if __name__ == "__main__":  
 #Delimited only needs to be used for training data!
-    arg = sys.argv[1]
+    #options start with -- and can go anywhere, the rest are positional args
+    opts = [x for x in sys.argv[1:] if x.startswith('--')]
+    argv = [x for x in sys.argv if not x.startswith('--')]
+    arg = argv[1]
+    #--context=N uses the N closest tokens on each side of a verb chain as features (default 1)
+    CorrectionFeatures.context_width = int(option_value(opts, '--context', 1))
     if arg == 'prep':
-    #ARGS prep inxml [delimitedxml] outfile.p
+    #ARGS prep inxml [delimitedxml] outfile.p [--columnar | --mapped]
     #If both xml files are passed in assume delimited output
-        if len(sys.argv) > 4: #delimited
-            inxml = sys.argv[2]
-            delimxml = sys.argv[3]
-            outfile = sys.argv[4]
-            sents = read_delimited_xml(inxml, delimxml)
-            pickle.dump(sents, open(outfile, 'wb'))
+    #the annotation files can also be CoreNLP json or CoNLL-U (chosen by extension, or by the contents)
+    #--columnar stores the sentences as a pickled ColumnarCorpus (much smaller, training/testing read either kind)
+    #--mapped writes a binary corpus file instead of a pickle, it is opened with mmap so sentences are only read when used
+    #The output is cached by a hash of the input files and options, so running prep again on unchanged files just copies it
+    #--no-cache always reads the files (and does not store the result), --cache-dir=dir, --cache-size=MB (default 2048)
+        import prepcache
+        if len(argv) > 4: #delimited
+            inputs = [argv[2], argv[3]]
+            outfile = argv[4]
+        else:
+            inputs = [argv[2]]
+            outfile = argv[3]
+        kind = 'mapped' if '--mapped' in opts else ('columnar' if '--columnar' in opts else 'list')
+        cache = None
+        if '--no-cache' not in opts:
+            cache = prepcache.PrepCache(option_value(opts, '--cache-dir', prepcache.DEFAULT_CACHE_DIR),
+                                        int(option_value(opts, '--cache-size', prepcache.DEFAULT_CACHE_SIZE // (1024 * 1024))) * 1024 * 1024)
+            #the VerbNet index changes which POS tags check_pos fixes, so it is part of the key
+            lexfile = vnlexicon.DEFAULT_LEXICON_FILE if os.path.exists(vnlexicon.DEFAULT_LEXICON_FILE) else None
+            key = prepcache.cache_key(inputs + ([lexfile] if lexfile else []),
+                                      [kind, 'lexicon' if lexfile else 'nltk'] + [annotation_format(f) for f in inputs])
+        if cache and cache.fetch(key, outfile):
+            print("Loaded from cache ({})".format(key[:12]))
         else:
-            inxml = sys.argv[2]
-            outfile = sys.argv[3]
-            sents = read_xml(inxml)
-            pickle.dump(sents, open(outfile, 'wb'))
+            if len(inputs) > 1:
+                sents = iter_delimited_sentences(inputs[0], inputs[1])
+            else:
+                sents = iter_sentences(inputs[0])
+            if kind == 'mapped':
+                write_corpus(ColumnarCorpus.from_sentences(sents), outfile)
+            else:
+                pfile = open(outfile, 'wb')
+                if kind == 'columnar':
+                    pickle.dump(ColumnarCorpus.from_sentences(sents), pfile)
+                else:
+                    pickle.dump(list(sents), pfile)
+                pfile.close()
+            if cache:
+                cache.store(key, outfile)
     elif arg == 'training': #create CorrectionFeatures instance data for correction model training from error delimed data
-    #ARGS training outfile.in sentfile.p ftype
-        outfile = sys.argv[2]
-        sentfile = sys.argv[3] #make pickle file last arg
-        ftype = sys.argv[4]
-        if ftype == 'aspect':
-            f = ASPECT_FEATS
-        elif ftype == 'person':
-            f = PERSON_NUM_FEATS
+    #ARGS training outfile.in sentfile.p ftype [--workers=N] [--context=N]
+    #ftype is aspect, person or both, both writes outfile.aspect.in and outfile.person.in from one pass over the sentences
+        outfile = argv[2]
+        sentfile = argv[3] #make pickle file last arg
+        types = feature_types(argv[4])
+        sents = load_sentences(sentfile)
+        if len(types) > 1:
+            outputs = [(typed_filename(outfile, name), None, f) for (name, f) in types]
         else:
-            f = 0
-            print("No valid type of features passed in")
-        sents = pickle.load(open(sentfile, 'rb'))
-        write_training_instances(sents, outfile, None, f)
+            outputs = [(outfile, None, types[0][1])]
+        write_training_sets(sents, outputs, int(option_value(opts, '--workers', 1)))
+        print("Chain cache (hits, misses, evictions): {}".format(CHAIN_CACHE.stats()))
     elif arg == 'testing': #create CorrectionFeatures instance data for testing, along with gold labels and original labels
-    #ARGS testing outfile.in corrlabels sentfile.p ftype    
-        outfile = sys.argv[2]
-        labelfile = sys.argv[3]
-        origfile = sys.argv[4]
-        sentfile = sys.argv[5]
-        ftype = sys.argv[6]
-        if ftype == 'aspect':
-            f = ASPECT_FEATS
-        elif ftype == 'person':
-            f = PERSON_NUM_FEATS
+    #ARGS testing outfile.in corrlabels origlabels sentfile.p ftype [--workers=N] [--context=N]
+    #ftype both writes the aspect and person files (outfile.aspect.in, corrlabels.aspect, ...) from one pass
+        outfile = argv[2]
+        labelfile = argv[3]
+        origfile = argv[4]
+        sentfile = argv[5]
+        types = feature_types(argv[6])
+        sents = load_sentences(sentfile)
+        if len(types) > 1:
+            outputs = [(typed_filename(outfile, name), typed_filename(labelfile, name), typed_filename(origfile, name), f)
+                       for (name, f) in types]
+        else:
+            outputs = [(outfile, labelfile, origfile, types[0][1])]
+        write_testing_sets(sents, outputs, int(option_value(opts, '--workers', 1)))
+        print("Chain cache (hits, misses, evictions): {}".format(CHAIN_CACHE.stats()))
+    elif arg == 'memory': #report how much memory a prepared sentence file takes per token
+    #ARGS memory sentfile.p
+        sentfile = argv[2]
+        sents = load_sentences(sentfile)
+        (ntokens, nbytes) = corpus_memory(sents)
+        print("Tokens: {}".format(ntokens))
+        print("Resident bytes per token: {:.1f}".format(nbytes / ntokens))
+        print("File bytes per token: {:.1f}".format(os.path.getsize(sentfile) / ntokens))
+    elif arg == 'vectorize': #turn an instance file into a sparse numeric matrix (outprefix.npz and outprefix.libsvm)
+    #ARGS vectorize instfile outprefix [--labels=labelfile] [--featmap=featmapfile] [--fthresh=N] [--hash=N]
+    #Without --labels the first entry on each line of instfile is the label (training instance files)
+    #Without --featmap a new feature map is learned (or features are hashed into N columns with --hash) and saved
+    #to outprefix.featmap, pass that file as --featmap when vectorizing the testing data
+        import vectorizer #needs numpy and scipy, only import it for this stage
+        instfile = argv[2]
+        outprefix = argv[3]
+        labelfile = option_value(opts, '--labels')
+        featfile = option_value(opts, '--featmap')
+        if featfile:
+            featmap = vectorizer.FeatureMap.load(featfile)
+        else:
+            featmap = vectorizer.learn_featmap(vectorizer.read_instances(instfile, labelfile),
+                                               int(option_value(opts, '--fthresh', 1)), int(option_value(opts, '--hash', 0)))
+            featmap.save(outprefix + '.featmap')
+        (X, y) = vectorizer.vectorize(vectorizer.read_instances(instfile, labelfile), featmap)
+        vectorizer.save_npz(outprefix + '.npz', X, y)
+        vectorizer.save_libsvm(outprefix + '.libsvm', X, y)
+        print("Instances: {} Features: {} Nonzeros: {}".format(X.shape[0], X.shape[1], X.nnz))
+    elif arg == 'readers': #check that a json/CoNLL-U annotation file gives the same Sentences as the xml, and time both readers
+    #ARGS readers xmlfile otherfile [delimitedxml delimitedother]
+    #(tests/test_readers.py checks the readers on the files in tests/data/readers, this is for checking other data)
+        if len(argv) > 5:
+            readers = [('xml', lambda: iter_delimited_xml(argv[2], argv[4])),
+                       (annotation_format(argv[3]), lambda: iter_delimited_sentences(argv[3], argv[5]))]
         else:
-            f = 0
-            print("No valid type of features passed in")
-        sents = pickle.load(open(sentfile, 'rb'))
-        write_testing_instances(sents, outfile, labelfile, origfile, f)
+            readers = [('xml', lambda: iter_xml(argv[2])), (annotation_format(argv[3]), lambda: iter_sentences(argv[3]))]
+        (ref, other) = [list(reader()) for (name, reader) in readers]
+        mismatches = [i for i in range(min(len(ref), len(other))) if sentence_record(ref[i]) != sentence_record(other[i])]
+        print("Sentences: {} {}, Mismatched sentences: {}".format(len(ref), len(other), len(mismatches)))
+        if mismatches:
+            print("First mismatch: {}".format(ref[mismatches[0]].tostring()))
+        for (name, reader) in readers:
+            start = time.time()
+            n = sum([1 for x in reader()])
+            print("{} reader: {:.0f} sentences/s".format(name, n / max(time.time() - start, 1e-9)))
     #ARGS outfile.in sentfile.p 
     else:  #get all instance data for language model training
         print("Get outta 'ere with that!")
@@ -6,46 +6,177 @@
 #
 ################################################################
 import lxml.etree as xml
+import multiprocessing
+import random
+import glob
 import sys
+import os
+
+ORIGINAL = 0
+CORRECTED = 1
+DELIMITED = 2
+
+def is_verb_error(err):
+	"""Return true if the NS error type err is one of the targeted verb errors"""
+	return err == 'AGV' or (len(err) > 1 and err[1] == 'V' and err[0] != 'M' and err[0] != 'U' and err[0] != 'R')
+
+def element_texts(elm, delimit_corrected=False):
+	"""Get the original, verb corrected, and delimited text of the element elm (and everything under it) in one
+		pass over the tree, without recursion (so deeply nested NS elements do not hit the recursion limit)
+		@params:
+			xml.Element elm - element holding the text data
+			bool delimit_corrected - whether to delimit the verb corrections in the corrected text (see get_vcorrected)
+		@ret:
+			3-Tuple of lists of strings (original, corrected, delimited), join each list to get the text
+	"""
+	orig = []
+	corr = []
+	delim = []
+	stack = [(elm, False)]
+	while stack:
+		(e, done) = stack.pop()
+		if done: #all children have been added, finish with the tail
+			if e.tail:
+				orig.append(e.tail)
+				corr.append(e.tail)
+				delim.append(e.tail)
+			continue
+		if e.tag == 'NS' and is_verb_error(e.get('type')): #mark the parts of the verb corrections
+			for i in e:
+				if i.tag == 'i':
+					i.set('delimit', 'yes')
+					i.set('use', 'no')
+				elif i.tag == 'c':
+					i.set('delimit', 'yes')
+					i.set('use', 'yes')
+		text = e.text
+		if text:
+			#original text only
+			if e.tag != 'c':
+				orig.append(text)
+			#corrected text, attribute marks whether or not we should use correction or original
+			use = e.get('use')
+			if use != 'no' and (e.tag != 'c' or use == 'yes'):
+				if delimit_corrected and use == 'yes':
+					corr.append(' @@ ' + text + ' @@ ')
+				else:
+					corr.append(text)
+			#delimit verb errors with @@ and corrections with ##
+			if e.get('delimit') == 'yes' and e.tag == 'i':
+				delim.append(' @@ ' + text + ' @@ ')
+			elif e.get('delimit') == 'yes' and e.tag == 'c':
+				delim.append(' ## ' + text + ' ## ')
+			elif e.tag != 'c':  #add regular data
+				delim.append(text)
+		stack.append((e, True))
+		stack.extend([(child, False) for child in reversed(e)])
+	return (orig, corr, delim)
+
+def extract_fce_xml(datafile, origout=None, corrout=None, delimout=None, workers=1):
+	"""Parse the fce xml file(s) once and write any of the original, verb corrected and delimited
+		text data to files
+		@params:
+			string datafile - fce xml file, a directory of them or a glob (see fce_files)
+			string origout - file to write the original text to (or None)
+			string corrout - file to write the text with verb errors corrected to (or None)
+			string delimout - file to write the delimited text to (or None)
+			int workers - number of processes to parse documents with
+		@ret:
+			number of documents read
+	"""
+	return extract_fce_files(fce_files(datafile), origout, corrout, delimout, workers)
+
+def extract_fce_files(files, origout=None, corrout=None, delimout=None, workers=1):
+	"""Same as extract_fce_xml for a list of fce xml files, output is in the order of files
+		(the same as running on one file with all of the documents concatenated)
+	"""
+	outfiles = [open(x, 'w') if x else None for x in (origout, corrout, delimout)]
+	if workers > 1 and len(files) > 1:
+		pool = multiprocessing.Pool(workers)
+		chunks = pool.imap(extract_document, files, chunksize=8) #imap keeps documents in order
+	else:
+		pool = None
+		chunks = (chunk for f in files for chunk in iter_fce_chunks(f)) #one paragraph at a time
+	for texts in chunks:
+		for (outfile, text) in zip(outfiles, texts):
+			if outfile:
+				outfile.write(text)
+	if pool:
+		pool.close()
+		pool.join()
+	for outfile in outfiles:
+		if outfile:
+			outfile.close()
+	return len(files)
+
+def fce_files(path):
+	"""Return the sorted list of fce xml files for path, which can be a single file,
+		a directory (every .xml file under it) or a glob pattern
+	"""
+	if os.path.isdir(path):
+		return sorted(glob.glob(os.path.join(path, '**', '*.xml'), recursive=True))
+	elif os.path.isfile(path):
+		return [path]
+	else:
+		return sorted(glob.glob(path, recursive=True))
+
+def split_files(files, test_ratio, seed=0):
+	"""Randomly split documents into training and testing sets
+		@params:
+			list files - fce xml files
+			float test_ratio - fraction of the documents to put in the testing set
+			int seed - seed for the split, the same seed and files always give the same split
+		@ret:
+			tuple (training files, testing files), each in the same order as files
+	"""
+	order = list(range(len(files)))
+	random.Random(seed).shuffle(order)
+	test = set(order[:int(round(len(files) * test_ratio))])
+	return ([f for (i, f) in enumerate(files) if i not in test], [f for (i, f) in enumerate(files) if i in test])
+
+def iter_fce_chunks(datafile):
+	"""Yield the (original, corrected, delimited) text of each paragraph in the fce xml file, as written to the output files"""
+	for texts in iter_fce_paragraphs(datafile):
+		yield tuple(["".join(text) + " " for text in texts])
+
+def extract_document(datafile):
+	"""Return the (original, corrected, delimited) text of a whole fce xml file (run by the worker processes)"""
+	chunks = list(iter_fce_chunks(datafile))
+	return tuple(["".join([c[i] for c in chunks]) for i in (ORIGINAL, CORRECTED, DELIMITED)])
+
+def iter_fce_paragraphs(datafile):
+	"""Yield the (original, corrected, delimited) text lists (see element_texts) of each <p> in the fce xml file"""
+	xfile = open(datafile, 'r')
+	data = xml.parse(xfile, xml.XMLParser(huge_tree=True)) #huge_tree lifts libxml2's nesting limit
+	xfile.close()
+	root = data.getroot()
+	for p in root.iter('p'):
+		yield element_texts(p)
 
 def read_fce_xml(datafile, corrected=True):
 	"""Read the the fce xml file from datafile and return the text data
-		as a string. 
+		as a string.
 		@params:
 			string datafile - fce xml file
-			bool corrected - If True, return the data with verb errors corrected, 
+			bool corrected - If True, return the data with verb errors corrected,
 							else return original
 		@returns:
 			text contents of the fce xml file
 	"""
-	sents = []
-	xfile = open(datafile, 'r')
-	data = xml.parse(xfile)
-	root = data.getroot()
-	strdata = ""
 	if corrected:
-		for p in root.iter('p'):
-			strdata = strdata + get_vcorrected(p) + " "
+		kind = CORRECTED
 	else:
-		for p in root.iter('p'):
-			strdata = strdata + get_original(p) + " "
-	return strdata
+		kind = ORIGINAL
+	return "".join(["".join(texts[kind]) + " " for texts in iter_fce_paragraphs(datafile)])
 
 def create_delimited(datafile):
-	"""Create String data with error annotations 
+	"""Create String data with error annotations
 		@params:
 			string datafile - fce xml file
 		@returns:
 			Annotated data as a string
 	"""
-	sents = []
-	xfile = open(datafile, 'r')
-	data = xml.parse(xfile)
-	root = data.getroot()
-	strdata = ""
-	for p in root.iter('p'):
-		strdata = strdata + delimit_data(p) + " "
-	return strdata
+	return "".join(["".join(texts[DELIMITED]) + " " for texts in iter_fce_paragraphs(datafile)])
 
 def delimit_data(elm):
 	"""Get String data for training (delimit verb errors with @@ and corrections with $$)
@@ -54,45 +185,16 @@ def delimit_data(elm):
 		@returns:
 			Delimited string data
 	"""
-	if elm.tag == 'NS':
-		err = elm.get('type')
-		if err == 'AGV' or (len(err) > 1 and err[1] == 'V' and err[0] != 'M' and err[0] != 'U' and err[0] != 'R'): #for all targeted verb corrs
-			for i in elm:
-				if i.tag == 'i' or i.tag == 'c': 
-					i.set('delimit', 'yes')
-	if elm.text: 
-		if elm.get('delimit') == 'yes' and elm.tag == 'i':  
-			data = ' @@ ' + elm.text + ' @@ '	#delimit verb errors
-		elif elm.get('delimit') == 'yes' and elm.tag == 'c':  
-			data = ' ## ' + elm.text + ' ## '	#delimit verb corrections
-		elif elm.tag != 'c':  #add regular data
-			data = elm.text
-		else:   #some weird exception
-			data = ""
-	else: #no text in element
-		data = ""
-	for child in elm:
-		data = data + delimit_data(child)
-	if elm.tail:
-		data = data + elm.tail
-	return data
+	return "".join(element_texts(elm)[DELIMITED])
 
 def get_original(elm):
 	"""Extract the original text data from the element elm
 		@params:
-			xml.Element elm - the element to get text data from 
+			xml.Element elm - the element to get text data from
 		@ret:
 			text data represented as a string
 	"""
-	if elm.text and elm.tag != 'c': #get the original text only
-		data = elm.text
-	else:
-		data = ""
-	for child in elm:
-		data = data + get_original(child)
-	if elm.tail:
-		data = data + elm.tail
-	return data
+	return "".join(element_texts(elm)[ORIGINAL])
 
 #Note dont use this method to delimit data, just pass a single argument
 def get_vcorrected(elm, delimit=False):
@@ -103,47 +205,44 @@ def get_vcorrected(elm, delimit=False):
 		@ret:
 			text data represented as a string
 	"""
-	if elm.text and elm.get('use') != 'no' and (elm.tag != 'c' or elm.get('use') == 'yes'): #attribute mark whether or not we should use correction or original
-		if delimit and elm.get('use') == 'yes':
-			data = ' @@ ' + elm.text + ' @@ '	#delimit verb errors
-		else:
-			data = elm.text 
-	else:
-		data = ""
-	if elm.tag == 'NS':
-		err = elm.get('type')
-		if err == 'AGV' or (len(err) > 1 and err[1] == 'V' and err[0] != 'M' and err[0] != 'U' and err[0] != 'R'): #for all verb corrs
-			for i in elm:
-				if i.tag == 'c':  #mark this element to use 
-					i.set('use', 'yes')
-				elif i.tag == 'i':  #mark this element to not use
-					i.set('use', 'no')
-	for child in elm:
-		data = data + get_vcorrected(child, delimit)
-	if elm.tail:
-		data = data + elm.tail
-	return data
+	return "".join(element_texts(elm, delimit)[CORRECTED])
 
 if __name__ == '__main__':
-	if sys.argv[1] == 'extract': #extract both fce corrected plain text or fce original plain text
-			infile = sys.argv[2]
-			if len(sys.argv) == 5:
-				gold = sys.argv[3]
-				orig = sys.argv[4]
-			else:
-				gold = 'goldout'
-				orig = 'origout'
-			gold_file = open(gold, 'w')	
-			orig_file = open(orig, 'w')
-			gold_file.write(read_fce_xml(infile, corrected=True))
-			orig_file.write(read_fce_xml(infile, corrected=False))
-		#Delimit fce error annotated data 
-		else: 
-			infile = sys.argv[2] #fce xml file
-			textout = sys.argv[3]
-			dataout_delim = sys.argv[4]
-			text_file = open(textout, 'w')
-			delim_file = open(dataout_delim, 'w')	
-			text_file.write(read_fce_xml(infile, corrected=False))
-			delim_file.write(create_delimited(infile))
-
+	#fcexmlfile can also be a directory of fce xml files or a quoted glob ('fce/dataset/*/*.xml'), documents are
+	#read in sorted order so there is no need to concatenate them first
+	#--workers=N parses the documents in N processes
+	#--test-ratio=F puts that fraction of the documents in a testing set, written to the same output names plus .test
+	#--seed=N seed for the train/test split (default 0)
+	opts = dict([x[2:].split('=', 1) for x in sys.argv[1:] if x.startswith('--') and '=' in x])
+	argv = [x for x in sys.argv if not x.startswith('--')]
+	workers = int(opts.get('workers', 1))
+	if argv[1] == 'extract': #extract both fce corrected plain text or fce original plain text
+	#ARGS extract fcexmlfile [goldout origout]
+		infile = argv[2]
+		if len(argv) == 5:
+			gold = argv[3]
+			orig = argv[4]
+		else:
+			gold = 'goldout'
+			orig = 'origout'
+		outputs = (orig, gold, None)
+	elif argv[1] == 'all': #original, corrected and delimited text from one pass
+	#ARGS all fcexmlfile origout goldout delimout
+		infile = argv[2]
+		outputs = (argv[3], argv[4], argv[5])
+	#Delimit fce error annotated data
+	else:
+	#ARGS delimit fcexmlfile textout delimout
+		infile = argv[2] #fce xml file
+		textout = argv[3]
+		dataout_delim = argv[4]
+		outputs = (textout, None, dataout_delim)
+	files = fce_files(infile)
+	if 'test-ratio' in opts:
+		(train, test) = split_files(files, float(opts['test-ratio']), int(opts.get('seed', 0)))
+		extract_fce_files(train, outputs[0], outputs[1], outputs[2], workers)
+		extract_fce_files(test, *[x + '.test' if x else None for x in outputs], workers=workers)
+		print("Training documents: {} Testing documents: {}".format(len(train), len(test)))
+	else:
+		extract_fce_files(files, outputs[0], outputs[1], outputs[2], workers)
+		print("Documents: {}".format(len(files)))
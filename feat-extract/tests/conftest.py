@@ -0,0 +1,13 @@
+#The feat-extract modules import each other by name (they are run as scripts from feat-extract),
+#so put feat-extract on the path for the tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vnlexicon
+
+#a small VerbNet stand in, so the tests do not need nltk_data (or a verbnet.lex built from it)
+TEST_LEMMAS = ['be', 'do', 'eat', 'give', 'go', 'have', 'run', 'travel']
+TEST_CLASSES = {'give': ('give', 'give'), 'go': ('escape',), 'run': ('run',), 'eat': ('eat',), 'travel': ('run',)}
+vnlexicon._lexicon = vnlexicon.VerbLexicon(TEST_LEMMAS, TEST_CLASSES)
@@ -0,0 +1,87 @@
+##########################################################
+#       test_corenlp_client.py
+#       CoreNLPClient against the local StubServer (no CoreNLP
+#       needed): retries, batch order and prev links across
+#       batches
+############################################################
+import time
+import random
+import pytest
+import corenlp_client as cc
+
+PARAGRAPHS = ["He went to the school{} .".format(i) for i in range(7)]
+DELIMITED = [("He go to the school{} .".format(i), "He @@ go @@ ## went ## to the school{} .".format(i)) for i in range(7)]
+
+@pytest.fixture
+def server():
+    stub = cc.StubServer(port=0, fail_next=1).start()
+    yield stub
+    stub.stop()
+
+def test_retry_with_backoff(server):
+    client = cc.CoreNLPClient(server.url, retries=3, backoff=0.2)
+    start = time.time()
+    data = client.annotate("He went .")
+    assert b'<word>went</word>' in data
+    assert time.time() - start >= 0.2 #waited before the retry
+    assert (client.requests, client.failures, server.requests) == (2, 1, 2)
+    server.fail_next = 2
+    start = time.time()
+    client.annotate("He went .")
+    assert time.time() - start >= 0.2 + 0.4 #backoff doubles
+    assert client.failures == 3
+    client.close()
+
+def test_gives_up_after_retries(server):
+    server.fail_next = 3
+    client = cc.CoreNLPClient(server.url, retries=2, backoff=0.01)
+    with pytest.raises(cc.AnnotationError) as err:
+        client.annotate("He went .")
+    assert err.value.status == 503
+    assert server.requests == 3
+    client.close()
+
+def test_client_errors_are_not_retried():
+    stub = cc.StubServer(port=0, fail_next=1, fail_status=400).start()
+    client = cc.CoreNLPClient(stub.url, retries=3, backoff=0.01)
+    try:
+        with pytest.raises(cc.AnnotationError) as err:
+            client.annotate("He went .")
+        assert err.value.status == 400
+        assert (client.requests, stub.requests) == (1, 1)
+    finally:
+        client.close()
+        stub.stop()
+
+def test_map_batches_keeps_order():
+    client = cc.CoreNLPClient(batch_size=3, max_in_flight=4)
+    def slow(batch): #later batches usually finish first
+        time.sleep(random.random() * 0.05)
+        return list(batch)
+    results = list(client.map_batches(slow, range(40)))
+    assert [len(b) for b in results] == [3] * 13 + [1]
+    assert [x for b in results for x in b] == list(range(40))
+
+def test_sentences_in_order(server):
+    client = cc.CoreNLPClient(server.url, batch_size=2, max_in_flight=3, backoff=0.01)
+    sents = list(client.sentences(PARAGRAPHS))
+    assert [s.sen[4].word for s in sents] == ["school{}".format(i) for i in range(7)]
+    client.close()
+
+def test_delimited_prev_links_cross_batches(server):
+    client = cc.CoreNLPClient(server.url, batch_size=2, max_in_flight=3, backoff=0.01)
+    sents = list(client.delimited_sentences(DELIMITED))
+    assert len(sents) == len(DELIMITED)
+    assert sents[0].prev is None
+    for i in range(1, len(sents)):
+        assert sents[i].prev is sents[i - 1] #sentences 2, 4 and 6 start a new batch
+    assert all([len(s.corr_pairs) == 1 for s in sents])
+    client.close()
+
+def test_counters_across_threads(server):
+    server.fail_next = 0
+    client = cc.CoreNLPClient(server.url, batch_size=1, max_in_flight=8, backoff=0.01)
+    results = list(client.map_batches(lambda batch: client.annotate(batch[0]), ["He went ."] * 200))
+    assert len(results) == 200
+    assert (client.requests, client.failures, server.requests) == (200, 0, 200)
+    client.close()
@@ -0,0 +1,77 @@
+##########################################################
+#       test_eval_results.py
+#       The vectorized evaluator against get_hit_stats, and the
+#       bootstrap / randomization comparison of two systems
+############################################################
+import gzip
+import random
+import warnings
+import numpy as np
+import pytest
+import eval_results as ev
+
+LABELS = ['PR_SIMPLE', 'PA_SIMPLE', 'INF', 'PR_PERF', 'FUTURE']
+
+def write_labels(tmpdir, name, labels):
+    path = str(tmpdir.join(name))
+    f = open(path, 'w')
+    f.write("".join([x + "\n" for x in labels]))
+    f.close()
+    return path
+
+def label_files(tmpdir, n=2000, seed=0):
+    """Random orig/gold labels (about 1 in 5 is an error) and two systems, returns (method a, method b, gold, orig)"""
+    rng = random.Random(seed)
+    orig = [rng.choice(LABELS) for i in range(n)]
+    gold = [o if rng.random() < 0.8 else rng.choice(LABELS) for o in orig]
+    a = [rng.choice([o, g, rng.choice(LABELS)]) for (o, g) in zip(orig, gold)]
+    b = [g if rng.random() < 0.5 else o for (o, g) in zip(orig, gold)]
+    return (write_labels(tmpdir, 'a', a), write_labels(tmpdir, 'b', b), write_labels(tmpdir, 'gold', gold),
+            write_labels(tmpdir, 'orig', orig))
+
+def read_labels(path):
+    return [x.strip('\n') for x in open(path).readlines()]
+
+def test_vectorized_matches_get_hit_stats(tmpdir, capsys):
+    (a, b, gold, orig) = label_files(tmpdir)
+    for method in (a, b):
+        stats = ev.get_hit_stats(read_labels(method), read_labels(gold), read_labels(orig))
+        (prec, recall, vstats, matrices) = ev.evaluate_vectorized(method, gold, orig)
+        assert vstats == stats
+        assert (prec, recall) == ev.evaluate(method, gold, orig)
+        assert matrices['per_label'][:, 1:].sum(axis=0).tolist() == list(stats)
+    capsys.readouterr()
+
+def test_trace_lists_every_hit(tmpdir, capsys):
+    (a, b, gold, orig) = label_files(tmpdir, n=200)
+    trace = str(tmpdir.join('trace.gz'))
+    stats = ev.evaluate_vectorized(a, gold, orig, trace_file=trace)[2]
+    lines = gzip.open(trace, 'rt').readlines()
+    assert len(lines) == sum(stats)
+    assert len([x for x in lines if ' TruePos: ' in x]) == stats[0]
+    capsys.readouterr()
+
+def test_shorter_label_file_is_an_error(tmpdir):
+    (a, b, gold, orig) = label_files(tmpdir, n=20)
+    short = write_labels(tmpdir, 'short', read_labels(gold)[:10])
+    with pytest.raises(ValueError):
+        ev.encode_label_files(a, short, orig)
+
+def test_compare_does_not_depend_on_workers(tmpdir):
+    (a, b, gold, orig) = label_files(tmpdir)
+    one = ev.compare_systems(a, b, gold, orig, samples=300, trials=300, seed=7, workers=1, batch=40)
+    two = ev.compare_systems(a, b, gold, orig, samples=300, trials=300, seed=7, workers=2, batch=40)
+    for key in ('scores', 'low', 'high', 'pvalue'):
+        assert np.array_equal(one[key], two[key], equal_nan=True)
+    assert (one['low'] <= one['scores']).all() and (one['scores'] <= one['high']).all()
+    assert one['pvalue'][1] < 0.05 #b recovers far more errors than a
+
+def test_undefined_scores_are_not_significant(tmpdir):
+    (a, b, gold, orig) = label_files(tmpdir, n=500)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error') #no All-NaN warnings
+        results = ev.compare_systems(orig, orig, gold, orig, samples=100, trials=100, seed=1)
+    #a system that never changes a label has no precision (or F-score)
+    assert np.isnan(results['scores'][0][0]) and np.isnan(results['pvalue'][0]) and np.isnan(results['pvalue'][2])
+    assert np.isnan(results['low'][0][0]) and np.isnan(results['high'][2][0])
+    assert results['pvalue'][1] == 1.0 #the same recall
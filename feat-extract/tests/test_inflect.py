@@ -0,0 +1,49 @@
+##########################################################
+#       test_inflect.py
+#       Spelling rules of inflect.py (forms are British, the
+#       FCE essays are)
+############################################################
+import sys
+import os
+import inflect
+
+def test_doubling_is_the_same_for_every_form():
+    assert inflect.verb_forms('quiz') == ('quiz', 'quizzed', 'quizzed', 'quizzes', 'quizzing')
+    assert inflect.verb_forms('stop') == ('stop', 'stopped', 'stopped', 'stops', 'stopping')
+
+def test_british_l_doubling():
+    assert inflect.verb_forms('travel') == ('travel', 'travelled', 'travelled', 'travels', 'travelling')
+    assert inflect.verb_forms('fuel')[1] == 'fuelled'
+    assert inflect.verb_forms('feel')[1] == 'felt'
+    assert inflect.verb_forms('appeal')[1] == 'appealed'
+    assert inflect.verb_forms('parallel')[1] == 'paralleled'
+
+def test_no_doubling():
+    assert inflect.verb_forms('visit')[1] == 'visited'
+    assert inflect.verb_forms('fix') == ('fix', 'fixed', 'fixed', 'fixes', 'fixing')
+    assert inflect.verb_forms('watch')[3] == 'watches'
+
+def test_irregular_and_multiword():
+    assert inflect.verb_forms('overtake')[1] == 'overtook'
+    assert inflect.verb_forms('take_off')[3] == 'takes_off'
+    assert inflect.inflect('be', inflect.THIRD_SINGULAR) == 'is'
+
+def test_table_round_trip(tmpdir):
+    filename = str(tmpdir.join('verbforms.txt'))
+    table = inflect.build_table(['quiz', 'travel', 'go'])
+    inflect.save_table(table, filename)
+    assert inflect.load_table(filename) == table
+
+def test_british_participles():
+    assert inflect.verb_forms('get') == ('get', 'got', 'got', 'gets', 'getting')
+    assert inflect.verb_forms('forget')[2] == 'forgotten'
+    assert inflect.TABLE_HEADER == '#verbforms 3' #tables built with gotten are not loaded
+
+def test_perl_check_reports_disagreements(tmpdir):
+    #a stand in for verbTenseChanger.pl (same arguments) that only knows the American participle of get
+    script = tmpdir.join('changer.py')
+    script.write("#!{}\nimport sys\nsys.path.insert(0, {!r})\nimport inflect\n"
+                 "print('gotten' if sys.argv[1:4:2] == ['get', '2'] else inflect.verb_forms(sys.argv[1])[int(sys.argv[3])])\n"
+                 .format(sys.executable, os.path.dirname(os.path.abspath(inflect.__file__))))
+    script.chmod(0o755)
+    assert list(inflect.perl_mismatches(['get', 'walk'], str(script))) == [('get', 2, 'got', 'gotten')]
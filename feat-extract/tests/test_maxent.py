@@ -0,0 +1,73 @@
+##########################################################
+#       test_maxent.py
+#       maxent.py's scorer, the data is in data/maxent:
+#       model.txt is a model in the ExportMaxEnt format trained
+#       on train.in with maxent.py (not by Mallet), so these
+#       tests only check the scorer against its own format
+#       Agreement with the Java classifier has NOT been checked:
+#       that needs mallet_model.txt and java_labels.out from
+#       scripts/make_maxent_fixture.sh (Java and Mallet), until
+#       they are committed that test is skipped
+############################################################
+import os
+import math
+import pytest
+import maxent
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'maxent')
+INSTANCES = os.path.join(DATA, 'instances.in')
+
+def read_lines(filename):
+    infile = open(filename, 'r')
+    lines = [x.rstrip('\n') for x in infile]
+    infile.close()
+    return lines
+
+def reference_labels(model_file, inst_file):
+    """Classify inst_file one instance at a time with plain python, straight from the ExportMaxEnt text file"""
+    lines = read_lines(model_file)
+    nlabels = int(lines[0].split()[1])
+    labels = lines[1:1 + nlabels]
+    nfeats = int(lines[1 + nlabels].split()[1])
+    features = lines[2 + nlabels:2 + nlabels + nfeats]
+    rows = [[float(w) for w in x.split()] for x in lines[3 + nlabels + nfeats:]]
+    weights = dict(zip(features, rows))
+    out = []
+    for line in read_lines(inst_file):
+        data = maxent.MALLET_LINE.match(line).group(2)
+        scores = list(rows[nfeats])
+        for f in maxent.MALLET_TOKEN.findall(data.lower()):
+            if f in weights:
+                scores = [s + w for (s, w) in zip(scores, weights[f])]
+        out.append(labels[scores.index(max(scores))])
+    return out
+
+def classify(model_file, tmpdir, batch_size=4096):
+    out_file = os.path.join(str(tmpdir), 'labels.out')
+    n = maxent.classify_file(maxent.MaxEntModel.load(model_file), INSTANCES, out_file, batch_size)
+    labels = read_lines(out_file)
+    assert n == len(labels)
+    return labels
+
+def test_classify_matches_reference(tmpdir):
+    model_file = os.path.join(DATA, 'model.txt')
+    assert classify(model_file, tmpdir) == reference_labels(model_file, INSTANCES)
+
+def test_batch_size_does_not_change_labels(tmpdir):
+    model_file = os.path.join(DATA, 'model.txt')
+    assert classify(model_file, tmpdir, batch_size=7) == classify(model_file, tmpdir)
+
+def test_npz_round_trip(tmpdir):
+    model = maxent.MaxEntModel.load(os.path.join(DATA, 'model.txt'))
+    npz_file = os.path.join(str(tmpdir), 'model.npz')
+    model.save(npz_file)
+    loaded = maxent.MaxEntModel.load(npz_file)
+    X = model.vectorize(read_lines(INSTANCES))
+    assert loaded.labels == model.labels and loaded.mallet
+    assert (loaded.predict(X) == model.predict(X)).all()
+    assert all([math.isclose(p, 1.0) for p in loaded.probabilities(X).sum(axis=1)])
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(DATA, 'java_labels.out')),
+                    reason="agreement with VChainClassifier unverified, run scripts/make_maxent_fixture.sh (needs Java and Mallet)")
+def test_agrees_with_java_classifier(tmpdir):
+    assert classify(os.path.join(DATA, 'mallet_model.txt'), tmpdir) == read_lines(os.path.join(DATA, 'java_labels.out'))
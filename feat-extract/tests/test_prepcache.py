@@ -0,0 +1,54 @@
+##########################################################
+#       test_prepcache.py
+#       Keys of the prep cache, and storing, fetching and
+#       evicting entries
+############################################################
+import ast
+import os
+import prepcache
+
+def write(path, text):
+    f = open(str(path), 'w')
+    f.write(text)
+    f.close()
+    return str(path)
+
+def test_key_changes_with_inputs_options_and_code(tmpdir):
+    data = write(tmpdir.join('data.xml'), '<root/>')
+    code = write(tmpdir.join('lingstructs.py'), 'class Token: pass\n')
+    key = prepcache.cache_key([data], ['list'], [code])
+    assert prepcache.cache_key([data], ['list'], [code]) == key
+    assert prepcache.cache_key([data], ['columnar'], [code]) != key
+    write(code, 'class Token:\n    __slots__ = ()\n')
+    assert prepcache.cache_key([data], ['list'], [code]) != key
+    new_code = prepcache.cache_key([data], ['list'], [code])
+    write(data, '<root></root>')
+    assert prepcache.cache_key([data], ['list'], [code]) != new_code
+
+def local_imports(filename):
+    """Names of the feat-extract modules filename imports at module level (not the ones other stages import)"""
+    names = set()
+    for node in ast.parse(open(filename).read()).body:
+        if isinstance(node, ast.Import):
+            names.update([x.name for x in node.names])
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module)
+    return set([x for x in names if os.path.exists(os.path.join(prepcache.SOURCE_DIR, x + '.py'))])
+
+def test_default_key_covers_the_prep_modules():
+    sources = [os.path.basename(x) for x in prepcache.PREP_SOURCES]
+    assert sources == ['lingstructs.py', 'process_data.py', 'corpus.py', 'vnlexicon.py', 'fst.py']
+    assert all([os.path.exists(x) for x in prepcache.PREP_SOURCES])
+    #everything the prep modules import is in the key too
+    for f in prepcache.PREP_SOURCES:
+        assert local_imports(f) <= set([x[:-3] for x in sources])
+
+def test_fetch_store_and_evict(tmpdir):
+    cache = prepcache.PrepCache(str(tmpdir.join('cache')), max_size=10)
+    out = write(tmpdir.join('out.p'), 'x' * 6)
+    assert not cache.fetch('a', out)
+    cache.store('a', out)
+    cache.store('b', out) #over max_size, the least recently used entry (a) goes
+    assert not cache.fetch('a', str(tmpdir.join('a.p')))
+    assert cache.fetch('b', str(tmpdir.join('b.p')))
+    assert open(str(tmpdir.join('b.p'))).read() == 'x' * 6
@@ -0,0 +1,60 @@
+##########################################################
+#       test_readers.py
+#       The json and CoNLL-U readers give the same Sentences as
+#       the xml reader, data/readers has the same annotations
+#       in each format (plain.deps.conllu has the relations in
+#       the DEPS column instead of HEAD/DEPREL)
+#       The order of the dependency relations counts (the
+#       feature lookups keep the first relation they find), the
+#       xml files have them in CoreNLP's order, which is the
+#       order the CoNLL-U reader puts them in
+#       The files are generated (the json and CoNLL-U from the
+#       xml), not CoreNLP output: they check that the readers
+#       agree on the same annotations, not that a CoreNLP json
+#       run gives the relations its xml run does (newer
+#       versions write enhancedPlusPlusDependencies, which are
+#       not the same as collapsed-ccprocessed-dependencies)
+############################################################
+import os
+import pytest
+import process_data as pd
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'readers')
+
+def data_file(name):
+    return os.path.join(DATA, name)
+
+def records(sents):
+    return [pd.sentence_record(s) for s in sents]
+
+@pytest.mark.parametrize('name', ['plain.json', 'plain.conllu', 'plain.deps.conllu'])
+def test_plain_readers_match_xml(name):
+    ref = records(pd.iter_xml(data_file('plain.xml')))
+    assert len(ref) > 0
+    assert records(pd.iter_sentences(data_file(name))) == ref
+
+@pytest.mark.parametrize('ext', ['json', 'conllu'])
+def test_delimited_readers_match_xml(ext):
+    ref = records(pd.iter_delimited_xml(data_file('plain.xml'), data_file('delim.xml')))
+    assert sum([len(r[2]) for r in ref]) > 0 #the fixture has correction pairs
+    assert records(pd.iter_delimited_sentences(data_file('plain.' + ext), data_file('delim.' + ext))) == ref
+
+def test_json_window_does_not_change_sentences():
+    f = open(data_file('plain.json'), 'r')
+    small = list(pd.json_array_items(f, 'sentences', chunk_size=5)) #every sentence is bigger than the window
+    f.close()
+    assert [(t['index'], t['word']) for s in small for t in s['tokens']] == \
+           [(t[0], t[1]) for (tokens, deps) in pd.iter_records(data_file('plain.json')) for t in tokens]
+
+def test_conllu_puts_relations_in_corenlp_order(tmpdir):
+    conllu = tmpdir.join('order.conllu')
+    conllu.write("1\the\the\t_\tPRP\t_\t2\tnsubj\t_\t_\n2\twent\tgo\t_\tVBD\t_\t0\troot\t_\t_\n"
+                 "3\thome\thome\t_\tNN\t_\t2\tadvmod\t_\t_\n\n")
+    (tokens, deps) = list(pd.iter_records(str(conllu)))[0]
+    assert [d[0] for d in deps] == ['root', 'nsubj', 'advmod']
+
+def test_annotation_format_sniffing(tmpdir):
+    for (name, fmt) in [('plain.xml', 'xml'), ('plain.json', 'json'), ('plain.conllu', 'conllu')]:
+        copy = tmpdir.join('annotations')
+        copy.write(open(data_file(name)).read())
+        assert pd.annotation_format(str(copy)) == fmt
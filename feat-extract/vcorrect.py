@@ -5,49 +5,100 @@
 #########################################################
 import process_data as pd
 import lingstructs as ling
+import inflect
 import subprocess as sub
 import sys
 
+PERL_CHECK = False #if true, also run verbTenseChanger.pl on every verb and report where it disagrees
+
+class SequenceMismatch(Exception):
+	'The sequence file does not have one label for each verb in the text'
+	pass
+
 def vcorrect(infile, seqfile, outfile='corrected.txt'): 
 	"""
 	Takes in the xml data outputted from the Stanford CoreNlp,
 	a file containing the correct sequence for verbs in that file,
 	and rewrites the original test with the corrections
+	The xml and the sequence file are both read as they are used, and corrected sentences
+	are written to outfile as soon as they are done
 	@params:
 		string infile - filename for the xml data
 		string seqfile - filename for the sequence data
 		(the ith line in file should represent the ith verb in the text
 		and contain the correct label for that verb)
 		string outfile - file to write corrected text to
+	@ret: number of verbs corrected
+	Raises a SequenceMismatch if the sequence file has fewer or more labels than the text has verbs
 	"""
 	sfile = open(seqfile, 'r')
-	seq = sfile.readlines() #get list containing seqence from file
-	sfile.close()
-	seq = [x for x in seq if x != '\n'] #remove blank lines
-	seq.reverse() #reverse so first element at end
-	sents = pd.read_xml(infile)
-	corrected = ""
-	for s in sents:
-		for tok in s.sen: 
-			#handle brackets
-			if tok.word == '-lrb-':
-				tok.word = '('
-			elif tok.word == '-rrb-':
-				tok.word = ')'
-			#change verb form if needed
-			elif tok.pos[0] == 'V':
-				label = seq.pop() #get the form this verb should be
-				tok.word = change_vform(tok.lemma, label) #change the verb form
-		corrected = corrected + s.tostring() + " " #add corrected sentence to text
-	#now write all corrected text
 	corrfile = open(outfile, 'w')
-	corrfile.write(corrected + "\n")
-	corrfile.close()
+	try:
+		labels = iter_labels(sfile)
+		count = 0
+		for s in pd.iter_xml(infile, getdeps=False): #dependencies are not needed to rewrite the text
+			count = count + correct_sentence(s, labels, seqfile)
+			corrfile.write(s.tostring() + " ")
+		corrfile.write("\n")
+		if next(labels, None) is not None:
+			raise SequenceMismatch("{} has more labels than the {} verbs in {}".format(seqfile, count, infile))
+	finally:
+		sfile.close()
+		corrfile.close()
+	return count
+
+def iter_labels(sfile):
+	"""Yield the labels in an open sequence file one at a time (blank lines are skipped)"""
+	for line in sfile:
+		if line != '\n':
+			yield line
+
+def correct_sentence(s, labels, seqfile=''):
+	"""
+	Rewrite the words of Sentence s in place, taking the form of each verb from labels
+	@params:
+		Sentence s
+		iterator labels - the labels for the verbs in this and the following sentences
+		string seqfile - name of the sequence file (for error messages)
+	@ret: number of verbs changed
+	"""
+	count = 0
+	for tok in s.sen: 
+		#handle brackets
+		if tok.word == '-lrb-':
+			tok.word = '('
+		elif tok.word == '-rrb-':
+			tok.word = ')'
+		#change verb form if needed
+		elif tok.pos[0] == 'V':
+			label = next(labels, None) #get the form this verb should be
+			if label is None:
+				raise SequenceMismatch("{} ran out of labels at verb '{}' in sentence '{}'".format(seqfile, tok.word, s.tostring()))
+			tok.word = change_vform(tok.lemma, label) #change the verb form
+			count = count + 1
+	return count
+
+def vcorrect_batch(docs):
+	"""
+	Correct many documents in one run
+	@params:
+		list docs - (xmlfile, seqfile, outfile) tuples
+	@ret: the number of documents that could not be corrected (the errors are printed)
+	"""
+	failed = 0
+	for (xmlfile, seqfile, outfile) in docs:
+		try:
+			vcorrect(xmlfile, seqfile, outfile)
+		except SequenceMismatch as e:
+			sys.stderr.write("Error: {}\n".format(e))
+			failed = failed + 1
+	return failed
 
 def change_vform(lemm, outlabel):
 	"""
 	Change the form of a verb from one form to another
-	Note: This method uses an external Perl script written by [Cite]
+	Note: This method uses the inflect module (it used to call an external Perl script
+	written by [Cite], which is still used as a cross check if PERL_CHECK is set)
 	@params:
 		string lemm - the lemma of the verb to change
 		string inlabel - the currect form label of the verb (use same labels as in the sequence file)
@@ -67,8 +118,17 @@ def change_vform(lemm, outlabel):
 		return 'was'
 	else:
 		out_form = get_label_id(outlabel)
-		outverb = sub.check_output(["./verbTenseChanger.pl", lemm, '0', str(out_form)])
-		return outverb.decode('utf-8')
+		outverb = inflect.inflect(lemm, out_form)
+		if PERL_CHECK:
+			perlverb = perl_vform(lemm, out_form)
+			if str.strip(perlverb) != outverb:
+				sys.stderr.write("Inflection mismatch for {} form {}: {} (perl {})\n".format(lemm, out_form, outverb, str.strip(perlverb)))
+		return outverb
+
+def perl_vform(lemm, out_form):
+	"""Change the form of a verb with the external Perl script (slow, starts a process per verb)"""
+	outverb = sub.check_output(["./verbTenseChanger.pl", lemm, '0', str(out_form)])
+	return outverb.decode('utf-8')
 
 def get_label_id(label):
 	"""Return the integer id for the corresponding label that can be given to the perl script"""	
@@ -87,11 +147,26 @@ def get_label_id(label):
 
 
 if __name__ == "__main__":					
-	xmlfile = sys.argv[1]
-	seqfile = sys.argv[2]
-	if len(sys.argv) > 3: #if the output file is specified
-		vcorrect(xmlfile, seqfile, sys.argv[3])
+	#ARGS xmlfile seqfile [outfile] [--perl-check]
+	#ARGS --batch xmlfile1 seqfile1 outfile1 [xmlfile2 seqfile2 outfile2 ...] [--perl-check]
+	#--perl-check runs ./verbTenseChanger.pl next to the inflect module and reports every verb they disagree on
+	PERL_CHECK = '--perl-check' in sys.argv
+	argv = [x for x in sys.argv if not x.startswith('--')]
+	if '--batch' in sys.argv:
+		files = argv[1:]
+		if len(files) % 3 != 0:
+			print("--batch needs an (xmlfile, seqfile, outfile) triple for every document")
+			sys.exit(1)
+		failed = vcorrect_batch([tuple(files[i:i+3]) for i in range(0, len(files), 3)])
+		if failed:
+			print("{} of {} documents failed".format(failed, len(files) // 3))
+			sys.exit(1)
 	else:
-		vcorrect(xmlfile, seqfile)
+		xmlfile = argv[1]
+		seqfile = argv[2]
+		if len(argv) > 3: #if the output file is specified
+			vcorrect(xmlfile, seqfile, argv[3])
+		else:
+			vcorrect(xmlfile, seqfile)
 	print("done")
 
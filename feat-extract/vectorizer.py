@@ -0,0 +1,151 @@
+##########################################################
+#       vectorizer.py
+#       Turns the text instance files written by process_data
+#       (one instance of space separated string features per line)
+#       into sparse numeric feature matrices (CSR), saved as
+#       NPZ (loadable with scipy.sparse.load_npz) and libsvm files
+############################################################
+import numpy as np
+import scipy.sparse as sparse
+from array import array
+import json
+import zlib
+
+FEATMAP_VERSION = 1
+
+class FeatureMap:
+    'Maps feature strings to column ids (learned from training data, or by hashing) and labels to label ids'
+    def __init__(self, features=None, labels=None, hash_size=0):
+        """@params:
+                list features - feature strings, the ith feature gets column i (not used when hashing)
+                list labels - label strings, the ith label gets id i
+                int hash_size - if > 0, features are hashed into this many columns instead of looked up
+        """
+        if not features:
+            features = []
+        if not labels:
+            labels = []
+        self.features = features
+        self.feature_ids = dict([(f, i) for (i, f) in enumerate(features)])
+        self.labels = labels
+        self.label_ids = dict([(l, i) for (i, l) in enumerate(labels)])
+        self.hash_size = hash_size
+
+    def num_features(self):
+        if self.hash_size > 0:
+            return self.hash_size
+        return len(self.features)
+
+    def feature_id(self, feat):
+        """Return the column for feature string feat, or None if it is not in the map"""
+        if self.hash_size > 0:
+            return zlib.crc32(feat.encode('utf-8')) % self.hash_size #crc32 so ids are the same in every process
+        return self.feature_ids.get(feat)
+
+    def label_id(self, label):
+        """Return the id for label, or -1 if it was not seen in the training data"""
+        return self.label_ids.get(label, -1)
+
+    def save(self, filename):
+        outfile = open(filename, 'w')
+        json.dump({'version': FEATMAP_VERSION, 'hash_size': self.hash_size,
+                   'labels': self.labels, 'features': self.features}, outfile)
+        outfile.close()
+
+    @staticmethod
+    def load(filename):
+        infile = open(filename, 'r')
+        data = json.load(infile)
+        infile.close()
+        if data.get('version') != FEATMAP_VERSION:
+            raise ValueError("{} has feature map version {}, expected {}".format(filename, data.get('version'), FEATMAP_VERSION))
+        return FeatureMap(data['features'], data['labels'], data['hash_size'])
+
+def read_instances(inst_file, label_file=None):
+    """Read an instance file one instance at a time
+        @params:
+            string inst_file - instance file, if label_file is None the first entry of each line is the label
+            string label_file - file with one label per line for the instances in inst_file (testing data)
+        @ret:
+            generator of (label, list of feature strings) tuples
+    """
+    ifile = open(inst_file, 'r')
+    lfile = None
+    if label_file:
+        lfile = open(label_file, 'r')
+    for line in ifile:
+        feats = line.split()
+        if lfile:
+            label = lfile.readline().strip('\n')
+        elif feats:
+            label = feats.pop(0)
+        else:
+            label = ''
+        yield (label, feats)
+    ifile.close()
+    if lfile:
+        lfile.close()
+
+def learn_featmap(instances, fthresh=1, hash_size=0):
+    """Build a FeatureMap from training instances
+        @params:
+            iterable instances - (label, feature list) tuples (see read_instances)
+            int fthresh - the minimum amount of times a feature should appear to be included
+            int hash_size - hash features into this many columns instead of learning a vocabulary
+    """
+    counts = {}
+    labels = set()
+    for (label, feats) in instances:
+        labels.add(label)
+        if hash_size > 0:
+            continue
+        for f in feats:
+            counts[f] = counts.get(f, 0) + 1
+    features = sorted([f for f in counts if counts[f] >= fthresh])
+    return FeatureMap(features, sorted(labels), hash_size)
+
+def vectorize(instances, featmap):
+    """Stream instances into a CSR matrix, features not in featmap are dropped, repeated features are counted
+        @params:
+            iterable instances - (label, feature list) tuples (see read_instances)
+            FeatureMap featmap
+        @ret:
+            tuple (scipy.sparse.csr_matrix X, numpy array of label ids y)
+    """
+    data = array('d')
+    indices = array('i')
+    indptr = array('q', [0])
+    labels = array('i')
+    for (label, feats) in instances:
+        row = {}
+        for f in feats:
+            i = featmap.feature_id(f)
+            if i is not None:
+                row[i] = row.get(i, 0) + 1
+        for i in sorted(row):
+            indices.append(i)
+            data.append(row[i])
+        indptr.append(len(indices))
+        labels.append(featmap.label_id(label))
+    X = sparse.csr_matrix((np.frombuffer(data, dtype=np.float64), np.frombuffer(indices, dtype=np.int32),
+                           np.frombuffer(indptr, dtype=np.int64)), shape=(len(labels), featmap.num_features()))
+    return (X, np.frombuffer(labels, dtype=np.int32))
+
+def save_npz(filename, X, y):
+    """Save X (and the labels y) in a file that scipy.sparse.load_npz can read (load_npz below also returns y)"""
+    np.savez_compressed(filename, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+                        format=np.array('csr'), labels=y)
+
+def load_npz(filename):
+    """Return (X, y) saved by save_npz"""
+    return (sparse.load_npz(filename), np.load(filename)['labels'])
+
+def save_libsvm(filename, X, y):
+    """Save X and y in libsvm format (feature indices start at 1)"""
+    outfile = open(filename, 'w')
+    for r in range(X.shape[0]):
+        start = X.indptr[r]
+        end = X.indptr[r+1]
+        feats = " ".join(["{}:{:g}".format(i + 1, v) for (i, v) in zip(X.indices[start:end], X.data[start:end])])
+        outfile.write("{} {}\n".format(y[r], feats).replace(" \n", "\n"))
+    outfile.close()
@@ -0,0 +1,104 @@
+##########################################################
+#       vnlexicon.py
+#       Holds the VerbNet data used during feature extraction
+#       (lemma list and verb classes) so that it only needs
+#       to be read from the NLTK corpus reader once, the data
+#       can be saved to a binary index file and loaded on startup
+############################################################
+from nltk.corpus import verbnet
+import os
+import sys
+import struct
+import pickle
+
+LEXICON_MAGIC = b'VNLX'
+LEXICON_VERSION = 1
+#default location of the index file, (next to this module)
+DEFAULT_LEXICON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'verbnet.lex')
+
+class VerbLexicon:
+    'Hashed set of VerbNet lemmas plus a table mapping lemma -> normalized VerbNet class names'
+    def __init__(self, lemmas, classes):
+        """@params:
+                iterable lemmas - all lemmas found in VerbNet
+                dict classes - maps a lemma to a tuple of its normalized class names (in VerbNet order)
+        """
+        self.lemmas = frozenset(lemmas)
+        self.classes = classes
+
+    def has_lemma(self, lem):
+        """Return true if the given lemma is found in the VerbNet verb list"""
+        return lem in self.lemmas
+
+    def class_feats(self, lem):
+        """Return a tuple of the normalized class names for lemma (empty if lemma is not in VerbNet)"""
+        return self.classes.get(lem, ())
+
+    def first_class(self, lem):
+        """Return the first normalized class name of lemma, or None if it has no classes"""
+        c = self.classes.get(lem)
+        if not c:
+            return None
+        else:
+            return c[0]
+
+    def save(self, filename=DEFAULT_LEXICON_FILE):
+        """Write the lexicon to a versioned binary index file"""
+        payload = pickle.dumps((sorted(self.lemmas), self.classes), pickle.HIGHEST_PROTOCOL)
+        outfile = open(filename, 'wb')
+        outfile.write(LEXICON_MAGIC)
+        outfile.write(struct.pack('<I', LEXICON_VERSION))
+        outfile.write(payload)
+        outfile.close()
+
+def normalize_class(classid):
+    """Strip the non alphabetic characters from a VerbNet class id (ie 'give-13.1-1' -> 'give')"""
+    return "".join([x for x in classid if str.isalpha(x)])
+
+def build_lexicon():
+    """Build a VerbLexicon from the NLTK VerbNet corpus reader (this is the slow part, only do it once)"""
+    lemmas = verbnet.lemmas()
+    classes = {}
+    for lem in lemmas:
+        c = verbnet.classids(lem)
+        if c:
+            classes[lem] = tuple([normalize_class(x) for x in c])
+    return VerbLexicon(lemmas, classes)
+
+def load_lexicon(filename=DEFAULT_LEXICON_FILE):
+    """Load a VerbLexicon from an index file made by VerbLexicon.save
+        @ret:
+            the VerbLexicon, or None if the file is missing or was written with a different version
+    """
+    if not os.path.exists(filename):
+        return None
+    infile = open(filename, 'rb')
+    data = infile.read()
+    infile.close()
+    if data[:4] != LEXICON_MAGIC or struct.unpack('<I', data[4:8])[0] != LEXICON_VERSION:
+        return None
+    (lemmas, classes) = pickle.loads(data[8:])
+    return VerbLexicon(lemmas, classes)
+
+_lexicon = None #shared lexicon, loaded on first use
+
+def get_lexicon(filename=DEFAULT_LEXICON_FILE):
+    """Return the shared VerbLexicon, loading it from the index file the first time this is called.
+        Falls back to building it from NLTK if the index file is missing.
+    """
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = load_lexicon(filename)
+        if _lexicon is None:
+            _lexicon = build_lexicon()
+    return _lexicon
+
+if __name__ == "__main__":
+    #ARGS build [outfile]
+    if sys.argv[1] == 'build':
+        if len(sys.argv) > 2:
+            outfile = sys.argv[2]
+        else:
+            outfile = DEFAULT_LEXICON_FILE
+        build_lexicon().save(outfile)
+    print("done")
@@ -1,3 +1,4 @@
 #!/bin/bash
 #echo "`java -cp /home/user/reu2015/programs/stanford-corenlp/*:. -Xmx2g edu.stanford.nlp.pipeline.StanfordCoreNLP -annotators tokenize,ssplit,pos,lemma,depparse -file $1`"
 echo "`java -cp /home/user/reu2015/programs/stanford-corenlp/*:. -Xmx4g edu.stanford.nlp.pipeline.StanfordCoreNLP [ -props annotate_properties.prop ] -file $1`"
+#to avoid starting a JVM per file, run a CoreNLP server once and use feat-extract/corenlp_client.py instead
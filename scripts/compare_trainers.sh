@@ -0,0 +1,19 @@
+#!/bin/bash
+#Time Mallet's MaxEnt trainer against python maxent.py train on the same instance files and print the wall time
+#and peak memory (max resident set, from /usr/bin/time) of each
+#to run do ./compare_trainers.sh aspect.in person.in (from the scripts directory), the instance files are the ones
+#process_data.py training writes for the FCE training data (python process_data.py training out.in trainout_delim.p both
+#writes out.aspect.in and out.person.in)
+#mallet_path is the same as in prep_data.sh
+mallet_path="mallet/bin/mallet"
+feat="`pwd`/../feat-extract"
+work="`mktemp -d`"
+trap 'rm -rf "$work"' EXIT
+
+for inst in "$@"; do
+	name="`basename $inst .in`"
+	echo "== $name (`wc -l < $inst` instances)"
+	echo "Mallet import-file: `/usr/bin/time -f '%es %MKB' $mallet_path import-file --input $inst --output $work/$name.mallet 2>&1 >/dev/null | tail -1`"
+	echo "Mallet train-classifier: `/usr/bin/time -f '%es %MKB' $mallet_path train-classifier --input $work/$name.mallet --output-classifier $work/$name.classifier --trainer MaxEnt --random-seed 0 2>&1 >/dev/null | tail -1`"
+	echo "maxent.py train: `/usr/bin/time -f '%es %MKB' python $feat/maxent.py train $inst $work/$name.npz 2>&1 >/dev/null | tail -1`"
+done
@@ -0,0 +1,19 @@
+#!/bin/bash
+#Make the Mallet half of the maxent.py test data in feat-extract/tests/data/maxent: train a Mallet MaxEnt classifier
+#on train.in, export it with ExportMaxEnt (mallet_model.txt) and classify instances.in with VChainClassifier
+#(java_labels.out). test_maxent.py checks that maxent.py gives the same labels as VChainClassifier with them
+#to run do ./make_maxent_fixture.sh (from the scripts directory)
+#classpath and mallet_path are the same as in run-classifier.sh and prep_data.sh
+classpath="/home/user/reu2015/programs/mallet/class:/home/user/reu2015/programs/mallet/lib/mallet-deps.jar:."
+mallet_path="mallet/bin/mallet"
+data="`pwd`/../feat-extract/tests/data/maxent"
+work="`mktemp -d`"
+trap 'rm -rf "$work"' EXIT
+
+echo "`$mallet_path import-file --input $data/train.in --output $work/train.mallet`"
+echo "`$mallet_path train-classifier --input $work/train.mallet --output-classifier $work/classifier --trainer MaxEnt --random-seed 0`"
+cp ../classiy-old/ExportMaxEnt.java ../classiy-old/VChainClassifier.java $work
+cd $work
+echo "`javac -cp $classpath ExportMaxEnt.java VChainClassifier.java`"
+echo "`java -cp $classpath ExportMaxEnt classifier $data/mallet_model.txt`"
+echo "`java -cp $classpath VChainClassifier --instances $data/instances.in --output $data/java_labels.out --classifier classifier --origlabels $data/origlabels`"
@@ -0,0 +1,32 @@
+#!/bin/bash
+#Compare the memory per token of the sentences read by the token classes before __slots__ (and interning)
+#with the current ones, on the same CoreNLP xml file
+#to run do ./memory_before_after.sh file.xml [delimited_file.xml] (run from inside the repository)
+#the old classes are taken from the commit in $before, set it to compare against another version
+before="${before:-776cbd2}"
+repo="`git rev-parse --show-toplevel`"
+old="`mktemp -d`"
+trap 'rm -rf "$old"' EXIT
+git -C "$repo" archive "$before" feat-extract | tar -x -C "$old"
+
+#tracemalloc counts what the read sentences still hold after reading, pickled size is the size of a prep output
+measure='
+import sys, tracemalloc, pickle
+sys.path.insert(0, sys.argv[1])
+import process_data as pd
+tracemalloc.start()
+if len(sys.argv) > 3:
+    sents = pd.read_delimited_xml(sys.argv[2], sys.argv[3])
+else:
+    sents = pd.read_xml(sys.argv[2])
+nbytes = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+ntokens = sum([len(s.sen) for s in sents])
+print("Tokens: {}".format(ntokens))
+print("Resident bytes per token: {:.1f}".format(nbytes / ntokens))
+print("Pickled bytes per token: {:.1f}".format(len(pickle.dumps(sents)) / ntokens))
+'
+echo "Before ($before):"
+echo "`python -c "$measure" "$old/feat-extract" "$@"`"
+echo "After:"
+echo "`python -c "$measure" "$repo/feat-extract" "$@"`"
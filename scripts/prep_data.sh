@@ -11,17 +11,17 @@
 mallet_path="mallet/bin/mallet"
 
 #The step BELOW takes the longest, to save time, this step serializes the list of Sentence objects
-#Only need to do this step if training data is changed
 #in trainout_delim.p and future steps just load this data (using Pickle module)
-#echo "`python process_data.py prep temp.xml trainout_delim.xml trainout_delim.p`"
+#prep caches its output by the contents of the xml files, so it only does the work again if the data changed
+echo "`python process_data.py prep temp.xml trainout_delim.xml trainout_delim.p`"
 
 #Create instance file for training
 echo "`python process_data.py training trainout_delim.in trainout_delim.p`"
 #convert instance file to mallet form and then train
 echo "`$mallet_path import-file --input trainout_delim.in --output trainout_delim.mallet`"
 echo "`$mallet_path train-classifier --input trainout_delim.mallet --output-classifier classifier --trainer MaxEnt --random-seed 0`"
-#Same with first step, but with testing data, only nneds to be done is testing data is changed
-#echo "`python process_data.py prep testout.xml testout_delim.xml testout_delim.p`"
+#Same with first step, but with testing data (also cached)
+echo "`python process_data.py prep testout.xml testout_delim.xml testout_delim.p`"
 #Create testing instances, put correct and original labels in seperate files
 echo "`python process_data.py testing testout_delim.in corrlabels origlabels testout_delim.p`"
 
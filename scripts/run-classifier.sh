@@ -10,3 +10,5 @@ echo "`javac -cp $classpath $1`"	#Compile
 echo "`java -cp $classpath $noext --instances $2 --output $3 --classifier $4 --origlabels $5`"  #Run
 
 #to evaluate results, use python eval_results.py resultsfile correctlabels origlabels
+#to score without a JVM, export the classifier once with ExportMaxEnt.java (java -cp $classpath ExportMaxEnt classifier_file model.txt)
+#then use python maxent.py classify model.txt instance_file where_to_print_output